@@ -8,6 +8,9 @@ from datetime import datetime
 from pyrogram import Client, filters
 from pyrogram.types import Message
 from database.db import db
+from Rexbots.progress import progress_bus
+from Rexbots.scheduler import transfer_scheduler
+from Rexbots.stats import stats_snapshot
 from config import ADMINS, DB_URI
 
 logger = logging.getLogger(__name__)
@@ -145,22 +148,34 @@ async def stats(client: Client, message: Message) -> None:
                    f"**Custom Caption:** {bool(user_info.get('caption', False))}\n" \
                    f"**Custom Thumbnail:** {bool(user_info.get('thumbnail', False))}"
         else:
-            total_users = await db.total_users_count()
-            premium_users = await db.total_premium_count()
-            banned_users = await db.total_banned_count()
-            
-            # Enhanced: Calculate more stats
-            active_sessions = await db.col.count_documents({'session': {'$ne': None}})
-            total_daily_usage = sum(user.get('daily_usage', 0) async for user in db.get_all_users())
+            # Global numbers come from the cached aggregation snapshot
+            snapshot = await stats_snapshot.get()
+            total_users = snapshot['total_users']
+            premium_users = snapshot['premium_users']
+            banned_users = snapshot['banned_users']
+            active_sessions = snapshot['active_sessions']
+            total_daily_usage = snapshot['daily_usage']
             avg_daily_usage = total_daily_usage / total_users if total_users > 0 else 0
+            share = lambda part: part / total_users * 100 if total_users > 0 else 0
+            cache = await db.file_cache_stats()
+            transfers = progress_bus.stats()
+            queue = transfer_scheduler.stats()
+            users_cache = db.user_cache_stats()
             
             text = f"**Bot Global Statistics 📊**\n\n" \
                    f"**Total Users:** {total_users}\n" \
-                   f"**Premium Users:** {premium_users} ({(premium_users / total_users * 100):.2f}%)\n" \
-                   f"**Banned Users:** {banned_users} ({(banned_users / total_users * 100):.2f}%)\n" \
+                   f"**Premium Users:** {premium_users} ({share(premium_users):.2f}%)\n" \
+                   f"**Banned Users:** {banned_users} ({share(banned_users):.2f}%)\n" \
                    f"**Active Sessions:** {active_sessions}\n" \
-                   f"**Total Daily Usage:** {total_daily_usage}\n" \
-                   f"**Average Daily Usage per User:** {avg_daily_usage:.2f}"
+                   f"**Total Daily Usage:** {total_daily_usage} ({snapshot['active_users']} users today)\n" \
+                   f"**Average Daily Usage per User:** {avg_daily_usage:.2f}\n" \
+                   f"**Lifetime Saves:** {snapshot['total_saves']} ({snapshot['total_bytes'] / 1024 ** 3:.2f} GiB)\n" \
+                   f"**File Cache:** {cache['entries']} files ({cache['hits']} hits / {cache['misses']} misses)\n" \
+                   f"**Live Transfers:** {transfers['active']} ({transfers['speed'] / 1024 / 1024:.2f} MiB/s)\n" \
+                   f"**Batches:** {queue['active']}/{queue['max_active']} running, " \
+                   f"{queue['premium_queued']} premium + {queue['free_queued']} free queued\n" \
+                   f"**User Cache:** {users_cache['entries']} users ({users_cache['hits']} hits / {users_cache['misses']} misses)\n\n" \
+                   f"__Totals as of {stats_snapshot.age:.0f}s ago__"
         
         await message.reply_text(text)
     except ValueError:
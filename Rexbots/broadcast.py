@@ -150,15 +150,9 @@ async def users_count(bot: Client, message: Message) -> None:
     msg = await message.reply_text(f"⏳ **__Gathering {filter_type.capitalize()} User Data...__**", quote=True)
     
     try:
-        if filter_type == "all":
-            users_cursor = db.get_all_users()
-            total = await db.total_users_count()
-        elif filter_type == "premium":
-            users_cursor = db.get_premium_users()
-            total = await db.total_premium_count()
-        elif filter_type == "banned":
-            users_cursor = db.get_banned_users()
-            total = await db.total_banned_count()
+        # Session strings stay in the database; the export only gets session_active
+        query = {"all": {}, "premium": {'is_premium': True}, "banned": {'is_banned': True}}[filter_type]
+        users_cursor = db.export_users(query)
         
         # Detailed Stats
         active_sessions = 0
@@ -175,16 +169,17 @@ async def users_count(bot: Client, message: Message) -> None:
                 "is_banned": user.get("is_banned", False),
                 "daily_usage": user.get("daily_usage", 0),
                 "limit_reset_time": str(user.get("limit_reset_time", "N/A")),
-                "session_active": bool(user.get("session")),
+                "session_active": user.get("session_active", False),
                 "dump_chat": user.get("dump_chat", "None"),
                 "delete_words_count": len(user.get("delete_words", [])),
                 "replace_words_count": len(user.get("replace_words", {})),
                 "caption_set": bool(user.get("caption")),
                 "thumbnail_set": bool(user.get("thumbnail"))
             })
-            active_sessions += 1 if user.get("session") else 0
+            active_sessions += 1 if user.get("session_active") else 0
             total_daily_usage += user.get("daily_usage", 0)
         
+        total = len(users_list)
         avg_daily_usage = total_daily_usage / total if total > 0 else 0
         
         await msg.edit_text(
@@ -1,6 +1,83 @@
+import re
+from typing import Any, Dict, List, Optional
+
 from pyrogram import Client, filters, enums
 from pyrogram.types import Message
-from database.db import db
+from config import USER_CACHE_SIZE, USER_CACHE_TTL
+from database.db import db, UserCache
+from Rexbots.context import get_context
+
+# ======================================================
+# Caption Template Engine
+# Templates are parsed once (on /set_caption) into text and field segments;
+# rendering is a join over those segments. Both placeholder families work,
+# and unknown placeholders are left in the caption unchanged.
+# ======================================================
+FIELD_ALIASES = {
+    'file_name': 'file_name', 'filename': 'file_name',
+    'file_size': 'file_size', 'size': 'file_size',
+    'date': 'date',
+    'caption': 'caption', 'source_caption': 'caption',
+    'msg_id': 'msg_id', 'message_id': 'msg_id',
+    'chat_name': 'chat_name', 'chat': 'chat_name',
+}
+PLACEHOLDER = re.compile(r"\{(\w+)\}")
+SAMPLE_VALUES = {
+    'file_name': "Video_File_2024.mp4", 'file_size': "1.2 GB", 'date': "2024-01-01 12:00:00",
+    'caption': "Original caption", 'msg_id': "1024", 'chat_name': "Source Channel",
+}
+
+
+def compile_caption(template: str) -> List[List[str]]:
+    """
+    Parses a template into [kind, value] segments: ["t", text] or ["f", field].
+    """
+    segments: List[List[str]] = []
+    pos = 0
+    for match in PLACEHOLDER.finditer(template):
+        field = FIELD_ALIASES.get(match.group(1).lower())
+        if field is None:
+            continue  # Unknown placeholder stays literal text
+        if match.start() > pos:
+            segments.append(["t", template[pos:match.start()]])
+        segments.append(["f", field])
+        pos = match.end()
+    if pos < len(template):
+        segments.append(["t", template[pos:]])
+    return segments
+
+
+def render_compiled(segments: List[List[str]], values: Dict[str, Any]) -> str:
+    """
+    Renders compiled segments; a missing value renders as an empty string.
+    """
+    return "".join(value if kind == "t" else str(values.get(value, "")) for kind, value in segments)
+
+
+class CaptionCache:
+    """
+    Compiled caption per user, loaded from the database on first use and
+    invalidated by /set_caption and /del_caption. Bounded like the user
+    cache, so idle users age out.
+    """
+    def __init__(self, max_size: int, ttl: float):
+        self._compiled = UserCache(max_size, ttl)
+
+    async def get(self, user_id: int) -> Optional[List[List[str]]]:
+        found, compiled = self._compiled.get(user_id)
+        if not found:
+            user = await db.get_caption_compiled(user_id) or {}
+            compiled = user.get('caption_compiled')
+            if compiled is None and user.get('caption'):
+                compiled = compile_caption(user['caption'])  # Saved before templates were compiled
+            self._compiled.put(user_id, compiled)
+        return compiled
+
+    def invalidate(self, user_id: int) -> None:
+        self._compiled.invalidate(user_id)
+
+
+caption_cache = CaptionCache(USER_CACHE_SIZE, USER_CACHE_TTL)
 
 # ======================================================
 # /set_caption - Set Custom Caption
@@ -8,12 +85,8 @@ from database.db import db
 @Client.on_message(filters.command("set_caption") & filters.private)
 async def set_caption(client: Client, message: Message):
     user_id = message.from_user.id
-    
-    # 1. Ensure User Exists
-    if not await db.is_user_exist(user_id):
-        await db.add_user(user_id, message.from_user.first_name)
 
-    # 2. Validate Input
+    # 1. Validate Input
     if len(message.command) < 2:
         return await message.reply_text(
             "<b>⚠️ Usage Error</b>\n\n"
@@ -21,19 +94,26 @@ async def set_caption(client: Client, message: Message):
             "<b>Correct Format:</b>\n"
             "<code>/set_caption Your Caption Here</code>\n\n"
             "<b>Supported Placeholders:</b>\n"
-            "• <code>{filename}</code> : Original File Name\n"
-            "• <code>{size}</code> : File Size\n\n"
+            "• <code>{filename}</code> / <code>{file_name}</code> : Original File Name\n"
+            "• <code>{size}</code> / <code>{file_size}</code> : File Size\n"
+            "• <code>{date}</code> : Delivery Date\n"
+            "• <code>{caption}</code> : Source Caption\n"
+            "• <code>{msg_id}</code> : Source Message ID\n"
+            "• <code>{chat_name}</code> : Source Chat Name\n\n"
             "<i>Example:</i> <code>/set_caption File: {filename} | Size: {size}</code>",
             parse_mode=enums.ParseMode.HTML
         )
 
-    # 3. Save to Database
+    # 2. Save to Database
     caption = message.text.split(" ", 1)[1].strip()
-    await db.set_caption(user_id, caption)
+    compiled = compile_caption(caption)
+    await db.set_caption(user_id, caption, compiled)
+    caption_cache.invalidate(user_id)
 
     await message.reply_text(
         "<b>✅ Custom Caption Saved!</b>\n\n"
-        f"<b>Preview:</b>\n<code>{caption}</code>\n\n"
+        f"<b>Template:</b>\n<code>{caption}</code>\n\n"
+        f"<b>Preview:</b>\n{render_compiled(compiled, SAMPLE_VALUES)}\n\n"
         "<i>This caption will be applied to your future downloads.</i>",
         parse_mode=enums.ParseMode.HTML
     )
@@ -43,14 +123,8 @@ async def set_caption(client: Client, message: Message):
 # ======================================================
 @Client.on_message(filters.command("see_caption") & filters.private)
 async def see_caption(client: Client, message: Message):
-    user_id = message.from_user.id
-    
-    # 1. Ensure User Exists
-    if not await db.is_user_exist(user_id):
-        await db.add_user(user_id, message.from_user.first_name)
-
-    # 2. Fetch Caption
-    caption = await db.get_caption(user_id)
+    # 1. Fetch Caption
+    caption = (await get_context(message)).caption
 
     if caption:
         await message.reply_text(
@@ -73,13 +147,9 @@ async def see_caption(client: Client, message: Message):
 @Client.on_message(filters.command("del_caption") & filters.private)
 async def del_caption(client: Client, message: Message):
     user_id = message.from_user.id
-    
-    # 1. Ensure User Exists
-    if not await db.is_user_exist(user_id):
-        await db.add_user(user_id, message.from_user.first_name)
 
-    # 2. Check if caption exists
-    caption = await db.get_caption(user_id)
+    # 1. Check if caption exists
+    caption = (await get_context(message)).caption
 
     if not caption:
         return await message.reply_text(
@@ -88,8 +158,9 @@ async def del_caption(client: Client, message: Message):
             parse_mode=enums.ParseMode.HTML
         )
 
-    # 3. Delete from Database
+    # 2. Delete from Database
     await db.del_caption(user_id)
+    caption_cache.invalidate(user_id)
 
     await message.reply_text(
         "<b>🗑 Custom Caption Removed</b>\n\n"
@@ -0,0 +1,114 @@
+# Rexbots
+# Don't Remove Credit
+# Telegram Channel @RexBots_Official
+
+import datetime
+from datetime import timezone, timedelta
+from typing import Any, Dict, List, Optional, Union
+
+from pyrogram import Client, filters, enums
+from pyrogram.types import CallbackQuery, Message
+
+from config import LOG_CHANNEL, FREE_DAILY_LIMIT
+from database.db import db
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+# ==============================================================================
+# 👤 USER CONTEXT
+# Handlers call get_context(), which loads the sender's document once per
+# update (one upsert round trip) and attaches it as `update.user_ctx`; later
+# db.get_* calls for the same user are served from the user cache this load
+# seeded. The group -1 hook below only registers genuinely new users: ids in
+# the known-user index pass through without touching Mongo.
+# ==============================================================================
+class UserContext:
+    """
+    Typed snapshot of one user's plan, limits and settings.
+    """
+    __slots__ = (
+        "user_id", "name", "is_premium", "premium_expiry", "is_banned",
+        "daily_usage", "daily_limit", "limit_reset_time", "caption", "thumbnail",
+        "dump_chat", "has_session", "delete_words", "replace_words", "total_saves", "total_bytes", "created"
+    )
+
+    def __init__(self, doc: Dict[str, Any], created: bool = False):
+        expiry = doc.get('premium_expiry')
+        self.user_id: int = doc['id']
+        self.name: Optional[str] = doc.get('name')
+        self.premium_expiry: Optional[datetime.datetime] = expiry
+        self.is_premium: bool = db.premium_active(doc)
+        self.is_banned: bool = bool(doc.get('is_banned'))
+        self.limit_reset_time: Optional[datetime.datetime] = doc.get('limit_reset_time')
+        window_open = self.limit_reset_time is not None and datetime.datetime.now() < self.limit_reset_time
+        # An expired window is only reset by the next counted file; show it as empty already
+        self.daily_usage: int = doc.get('daily_usage', 0) if window_open else 0
+        self.daily_limit: Optional[int] = None if self.is_premium else FREE_DAILY_LIMIT
+        self.caption: Optional[str] = doc.get('caption')
+        self.thumbnail: Optional[str] = doc.get('thumbnail')
+        self.dump_chat: Optional[int] = doc.get('dump_chat')
+        self.has_session: bool = bool(doc.get('session'))
+        self.delete_words: List[str] = doc.get('delete_words') or []
+        self.replace_words: Dict[str, str] = doc.get('replace_words') or {}
+        self.total_saves: int = doc.get('total_saves', 0)
+        self.total_bytes: int = doc.get('total_bytes', 0)
+        self.created: bool = created
+
+
+async def get_context(update: Union[Message, CallbackQuery]) -> UserContext:
+    """
+    Returns the context the middleware attached, loading it if the update
+    bypassed the middleware (e.g. group chats).
+    """
+    ctx = getattr(update, "user_ctx", None)
+    if ctx is None:
+        user = update.from_user
+        doc, created = await db.load_user(user.id, user.first_name)
+        ctx = UserContext(doc, created)
+        update.user_ctx = ctx
+    return ctx
+
+
+async def log_new_user(client: Client, message: Message) -> None:
+    user = message.from_user
+    now = datetime.datetime.now(IST)
+    username_text = f"@{user.username}" if user.username else "<i>None</i>"
+
+    new_user_text = (
+        f"<b><i>#NewUser 👤 Joined the Bot</i></b>\n\n"
+        f"<b>Bot:</b> @{client.me.username}\n\n"
+        f"<b>User:</b> {user.mention(style='html')}\n"
+        f"<b>Username:</b> {username_text}\n"
+        f"<b>User ID:</b> <code>{user.id}</code>\n\n"
+        f"<b>📅 Date:</b> <code>{now.strftime('%d %B %Y')}</code>\n"
+        f"<b>🕒 Time:</b> <code>{now.strftime('%I:%M %p')} IST</code>\n\n"
+        f"<b>Developed by @RexBots_Official</b>"
+    )
+
+    try:
+        await client.send_message(
+            LOG_CHANNEL,
+            new_user_text,
+            parse_mode=enums.ParseMode.HTML,
+            disable_web_page_preview=True
+        )
+        logger.info(f"New user logged: {user.id} - {user.first_name}")
+    except Exception as e:
+        logger.error(f"Failed to log new user {user.id}: {e}")
+
+
+@Client.on_message(filters.private & filters.incoming, group=-1)
+async def register_new_user(client: Client, message: Message):
+    if not message.from_user or db.is_known_user(message.from_user.id):
+        return
+    try:
+        ctx = await get_context(message)
+    except Exception as e:
+        logger.error(f"Failed to load user context for {message.from_user.id}: {e}")
+        return
+    if ctx.created:
+        await log_new_user(client, message)
+
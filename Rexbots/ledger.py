@@ -0,0 +1,99 @@
+# Rexbots
+# Don't Remove Credit
+# Telegram Channel @RexBots_Official
+
+import asyncio
+import datetime
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from config import USAGE_FLUSH_INTERVAL
+from database.db import db
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+# ==============================================================================
+# 🧾 WRITE-BEHIND USAGE LEDGER
+# Delivered files are counted in memory (files, bytes, transfer seconds per
+# user per day) and flushed every USAGE_FLUSH_INTERVAL seconds with bulk
+# writes, so transfers never wait on a counter update. The daily quota is
+# separate and stays synchronous (Database.consume_quota).
+# ==============================================================================
+class UsageLedger:
+    """
+    Buffered usage counters keyed by (user_id, day).
+    """
+    def __init__(self, interval: int):
+        self.interval = max(interval, 1)
+        self._pending: Dict[Tuple[int, str], List[float]] = {}
+        self._failed: Optional[Tuple[str, Dict[Tuple[int, str], List[float]]]] = None  # (flush_id, entries)
+        self._flusher: Optional[asyncio.Task] = None
+
+    def record(self, user_id: int, size: int = 0, seconds: float = 0.0, files: int = 1) -> None:
+        """
+        Counts delivered files for a user. Starts the flusher on first use.
+        """
+        key = (user_id, datetime.date.today().isoformat())
+        entry = self._pending.setdefault(key, [0, 0, 0.0])
+        entry[0] += files
+        entry[1] += size or 0
+        entry[2] += seconds
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    def pending(self, user_id: int) -> Tuple[int, int, float]:
+        """
+        Counters of a user that are not flushed yet (files, bytes, seconds).
+        """
+        files, size, seconds = 0, 0, 0.0
+        batches = [self._pending] + ([self._failed[1]] if self._failed else [])
+        for (uid, _), entry in (item for batch in batches for item in batch.items()):
+            if uid == user_id:
+                files += entry[0]
+                size += entry[1]
+                seconds += entry[2]
+        return files, size, seconds
+
+    def stats(self) -> Dict[str, int]:
+        return {'pending': len(self._pending) + (len(self._failed[1]) if self._failed else 0)}
+
+    async def flush(self) -> None:
+        """
+        Writes all buffered counters. A failed batch is kept as it is, under
+        its flush id, and re-sent before anything newer; the database skips
+        the documents it already reached, so nothing is counted twice.
+        """
+        if self._failed:
+            flush_id, entries = self._failed
+            try:
+                await db.apply_usage(entries, flush_id, retry=True)
+            except Exception as e:
+                logger.error(f"Usage ledger retry failed ({len(entries)} entries): {e}")
+                return
+            self._failed = None
+        if not self._pending:
+            return
+        flush_id, entries = uuid.uuid4().hex, self._pending
+        self._pending = {}
+        try:
+            await db.apply_usage(entries, flush_id)
+        except Exception as e:
+            logger.error(f"Usage ledger flush failed ({len(entries)} entries): {e}")
+            self._failed = (flush_id, entries)
+
+    async def _flush_loop(self) -> None:
+        while self._pending or self._failed:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def close(self) -> None:
+        """
+        Stops the flusher and writes what is left. Called on bot shutdown.
+        """
+        if self._flusher:
+            self._flusher.cancel()
+        await self.flush()
+
+
+usage_ledger = UsageLedger(USAGE_FLUSH_INTERVAL)
@@ -0,0 +1,129 @@
+# Rexbots
+# Don't Remove Credit
+# Telegram Channel @RexBots_Official
+
+import asyncio
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterable, List, Optional, Union
+
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+_DONE = object()
+
+
+async def _iterate(items):
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+# ==============================================================================
+# 🏭 BOUNDED STAGE PIPELINE
+# Items flow through a chain of stages connected by bounded queues. A full
+# queue blocks the stage in front of it (backpressure), so a slow upload
+# never lets downloads pile up on disk beyond the configured depth.
+# ==============================================================================
+class Stage:
+    """
+    One step of a pipeline.
+
+    - `func(item)` returns the item for the next stage, or None to drop it.
+    - `depth` is the size of the queue feeding this stage.
+    - `workers` is how many items the stage processes at once. Keep it at 1
+      where delivery order matters.
+    """
+    def __init__(self, name: str, func: Callable[[Any], Awaitable[Any]], depth: int = 1, workers: int = 1):
+        self.name = name
+        self.func = func
+        self.depth = max(depth, 1)
+        self.workers = max(workers, 1)
+
+
+class Pipeline:
+    """
+    Runs items through stages concurrently: while stage 2 handles item N,
+    stage 1 already works on item N+1.
+    """
+    def __init__(
+        self,
+        stages: List[Stage],
+        should_stop: Optional[Callable[[], bool]] = None,
+        on_error: Optional[Callable[[Stage, Any, Exception], Awaitable[None]]] = None
+    ):
+        self.stages = stages
+        self.should_stop = should_stop or (lambda: False)
+        self.on_error = on_error
+
+    async def run(self, items: Union[Iterable[Any], AsyncIterable[Any]]) -> None:
+        """
+        Feeds items (a plain or async iterable) into the first stage and waits
+        until every stage drains. Feeding stops early once `should_stop()`
+        returns True; items already inside the pipeline still reach their
+        stage functions so they can clean up after themselves. An error raised
+        by the item source is re-raised after the pipeline drains.
+        """
+        queues = [asyncio.Queue(maxsize=stage.depth) for stage in self.stages]
+        runners = [
+            asyncio.create_task(self._run_stage(i, queues[i], queues[i + 1] if i + 1 < len(queues) else None))
+            for i in range(len(self.stages))
+        ]
+        feed_error = None
+        try:
+            try:
+                async for item in _iterate(items):
+                    if self.should_stop():
+                        break
+                    await queues[0].put(item)
+            except Exception as e:
+                feed_error = e
+            for _ in range(self.stages[0].workers):
+                await queues[0].put(_DONE)
+            await asyncio.gather(*runners)
+        finally:
+            for runner in runners:
+                runner.cancel()
+        if feed_error:
+            raise feed_error
+
+    async def _run_stage(self, index: int, inbox: asyncio.Queue, outbox: Optional[asyncio.Queue]) -> None:
+        stage = self.stages[index]
+
+        async def worker():
+            # Nothing raised while handling an item may end the loop: a dead
+            # worker would stop draining its inbox and the stages in front of
+            # it (and the feeder) would block on full queues forever.
+            while True:
+                item = await inbox.get()
+                if item is _DONE:
+                    return
+                try:
+                    result = await stage.func(item)
+                except Exception as e:
+                    logger.error(f"Pipeline stage '{stage.name}' failed: {e}")
+                    await self._report(stage, item, e)
+                    continue
+                if result is not None and outbox is not None:
+                    await outbox.put(result)
+
+        results = await asyncio.gather(*(worker() for _ in range(stage.workers)), return_exceptions=True)
+        dead = [r for r in results if isinstance(r, BaseException)]
+        for error in dead:
+            logger.error(f"Pipeline stage '{stage.name}' worker died: {error}")
+        # Drain (and drop) what dead workers left behind until their _DONE markers arrive
+        while dead:
+            if await inbox.get() is _DONE:
+                dead.pop()
+        if outbox is not None:
+            for _ in range(self.stages[index + 1].workers):
+                await outbox.put(_DONE)
+
+    async def _report(self, stage: Stage, item: Any, error: Exception) -> None:
+        if not self.on_error:
+            return
+        try:
+            await self.on_error(stage, item, error)
+        except Exception as e:
+            logger.error(f"Pipeline stage '{stage.name}': error handler failed: {e}")
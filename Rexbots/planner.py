@@ -0,0 +1,72 @@
+# Rexbots
+# Don't Remove Credit
+# Telegram Channel @RexBots_Official
+
+from typing import AsyncIterator, Callable, List, Optional, Union
+
+from pyrogram import Client
+from pyrogram.types import Message
+
+from config import PLANNER_CHUNK_SIZE
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+# Telegram accepts at most 200 ids per messages.getMessages / channels.getMessages
+MAX_IDS_PER_CALL = 200
+
+# ==============================================================================
+# 🗺 BATCH RANGE PLANNER
+# Fetches a message id range in chunks and yields only deliverable messages,
+# so gaps of deleted posts cost nothing beyond one shared RPC.
+# ==============================================================================
+async def plan_range(
+    acc: Client,
+    chat_id: Union[int, str],
+    from_id: int,
+    to_id: int,
+    classify: Callable[[Message], Optional[str]],
+    chunk_size: int = PLANNER_CHUNK_SIZE
+) -> AsyncIterator[Message]:
+    """
+    Yields the messages in [from_id, to_id] that are worth processing.
+    Empty (deleted) ids, service messages and types `classify` does not
+    recognise are dropped before they reach the transfer stages.
+    """
+    chunk_size = max(1, min(chunk_size, MAX_IDS_PER_CALL))
+    skipped = 0
+    for start in range(from_id, to_id + 1, chunk_size):
+        ids = list(range(start, min(start + chunk_size, to_id + 1)))
+        try:
+            messages = await acc.get_messages(chat_id, ids)
+        except Exception as e:
+            logger.error(f"Planner: failed to fetch ids {ids[0]}-{ids[-1]} from {chat_id}: {e}")
+            raise
+
+        for msg in messages or []:
+            if not msg or msg.empty or msg.service or not classify(msg):
+                skipped += 1
+                continue
+            yield msg
+
+    if skipped:
+        logger.info(f"Planner: skipped {skipped} empty/unsupported ids in {chat_id} {from_id}-{to_id}")
+
+
+async def group_albums(messages: AsyncIterator[Message]) -> AsyncIterator[Union[Message, List[Message]]]:
+    """
+    Collapses consecutive messages sharing a `media_group_id` into one list
+    so an album can be delivered with a single send_media_group call.
+    Messages outside an album pass through unchanged.
+    """
+    album: List[Message] = []
+    async for msg in messages:
+        if album and msg.media_group_id != album[0].media_group_id:
+            yield album if len(album) > 1 else album[0]
+            album = []
+        if msg.media_group_id:
+            album.append(msg)
+        else:
+            yield msg
+    if album:
+        yield album if len(album) > 1 else album[0]
@@ -1,3 +1,4 @@
+import asyncio
 from pyrogram import Client, filters, enums
 from pyrogram.types import (
     Message,
@@ -6,12 +7,22 @@ from pyrogram.types import (
     InlineKeyboardButton
 )
 from database.db import db
-from config import ADMINS
+from Rexbots.context import get_context
+from Rexbots.ledger import usage_ledger
+from config import ADMINS, PREMIUM_SWEEP_INTERVAL
 from datetime import date, datetime, timedelta
 from logger import LOGGER
 
 logger = LOGGER(__name__)
 
+def format_size(size: int) -> str:
+    """Bytes as a short human-readable string."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.2f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+    return f"{size:.2f} TB"
+
 # ======================================================
 # USER COMMANDS - Professional & Informative
 # ======================================================
@@ -19,21 +30,24 @@ logger = LOGGER(__name__)
 # /myplan - Detailed Plan & Quota Overview
 @Client.on_message(filters.command("myplan") & filters.private)
 async def my_plan(client: Client, message: Message):
-    user_id = message.from_user.id
-    
-    # 1. Ensure User Exists (Fixing the 'ensure_user' error manually)
-    if not await db.is_user_exist(user_id):
-        await db.add_user(user_id, message.from_user.first_name)
-
-    # 2. Fetch User Data Directly from DB
-    user_data = await db.col.find_one({'id': user_id})
-    
-    # Defaults
-    is_premium = user_data.get('is_premium', False)
-    expiry = user_data.get('premium_expiry')
-    daily_usage = user_data.get('daily_usage', 0)
-    # Note: total_saves needs to be tracked in your traffic logic to show up here
-    total_saves = user_data.get('total_saves', 0) 
+    # 1. User Data (loaded by the context middleware)
+    ctx = await get_context(message)
+
+    is_premium = ctx.is_premium
+    expiry = ctx.premium_expiry
+    daily_usage = ctx.daily_usage
+
+    # 2. Lifetime & 7-Day Usage (flushed ledger + counts still buffered in memory)
+    pending_files, pending_bytes, _ = usage_ledger.pending(ctx.user_id)
+    total_saves = ctx.total_saves + pending_files
+    total_data = format_size(ctx.total_bytes + pending_bytes)
+    history = await db.get_usage_history(ctx.user_id, days=7)
+    week_saves = sum(day.get('files', 0) for day in history) + pending_files
+    usage_text = (
+        f"<b>📊 Total Lifetime Saves:</b> <code>{total_saves}</code>\n"
+        f"<b>💾 Total Data Saved:</b> <code>{total_data}</code>\n"
+        f"<b>📅 Last 7 Days:</b> <code>{week_saves} files</code>\n\n"
+    )
 
     # 3. Generate Status Text
     if is_premium:
@@ -59,19 +73,19 @@ async def my_plan(client: Client, message: Message):
             f"<b>📅 Expiry:</b> {expiry_text}\n\n"
             f"<b>♾️ Daily Tokens:</b> Unlimited\n"
             f"<b>♾️ Batch Limit:</b> Unlimited\n"
-            f"<b>📊 Total Lifetime Saves:</b> <code>{total_saves}</code>\n\n"
+            f"{usage_text}"
             "<i>Thank you for supporting the bot! 🎉</i>"
         )
     else:
         # Free Logic
-        daily_limit = 10
+        daily_limit = ctx.daily_limit
         tokens_left = max(0, daily_limit - daily_usage)
         
         plan_text = (
             f"<b>👤 Plan: Free Tier</b>\n\n"
             f"<b>🎫 Daily Tokens:</b> <code>{tokens_left} / {daily_limit}</code>\n"
             f"<b>📦 File Size Limit:</b> <code>2 GB</code>\n"
-            f"<b>📊 Total Lifetime Saves:</b> <code>{total_saves}</code>\n\n"
+            f"{usage_text}"
             "<i>Upgrade to Premium for unlimited access! 🚀</i>"
         )
 
@@ -132,6 +146,26 @@ async def show_premium_plans(message_or_query):
             disable_web_page_preview=True
         )
 
+# ======================================================
+# PREMIUM EXPIRY SWEEPER - Background Task (started in bot.py)
+# ======================================================
+async def premium_sweeper():
+    """Normalizes legacy expiries once, then expires lapsed plans every PREMIUM_SWEEP_INTERVAL seconds."""
+    try:
+        fixed = await db.normalize_premium_expiries()
+        if fixed:
+            logger.info(f"Premium sweeper: normalized {fixed} stored expiries")
+    except Exception as e:
+        logger.error(f"Premium sweeper: expiry normalization failed: {e}")
+    while True:
+        try:
+            expired = await db.expire_premiums()
+            if expired:
+                logger.info(f"Premium sweeper: expired {expired} plans")
+        except Exception as e:
+            logger.error(f"Premium sweeper error: {e}")
+        await asyncio.sleep(PREMIUM_SWEEP_INTERVAL)
+
 # ======================================================
 # ADMIN COMMANDS - Secure & Detailed
 # ======================================================
@@ -0,0 +1,191 @@
+# Rexbots
+# Don't Remove Credit
+# Telegram Channel @RexBots_Official
+
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+
+from pyrogram import Client, enums
+from pyrogram.errors import FloodWait, MessageNotModified
+from pyrogram.types import Message
+
+from config import PROGRESS_EDIT_INTERVAL
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+SPEED_ALPHA = 0.3      # EWMA weight of the newest throughput sample
+SAMPLE_INTERVAL = 0.5  # Seconds between throughput samples
+PUBLISH_INTERVAL = 1.0 # Seconds between rendered status texts per tracker
+
+# ==============================================================================
+# 📈 PER-TRANSFER TRACKER
+# Owned by the transfer job and freed with it. Throughput is an exponentially
+# weighted moving average of short samples, so the ETA follows the link's
+# current speed instead of the lifetime average.
+# ==============================================================================
+class TransferTracker:
+    """
+    Progress numbers of one transfer. `reset()` starts a new phase
+    (relay, download, upload) on the same status message.
+    """
+    __slots__ = (
+        "key", "user_id", "status", "current", "total", "started",
+        "speed", "_sample_time", "_sample_bytes", "_published"
+    )
+
+    def __init__(self, key: Tuple[int, int], user_id: int):
+        self.key = key
+        self.user_id = user_id
+        self.reset("Processing")
+
+    def reset(self, status: str, total: int = 0) -> None:
+        now = time.monotonic()
+        self.status = status
+        self.current = 0
+        self.total = total
+        self.started = now
+        self.speed = 0.0
+        self._sample_time = now
+        self._sample_bytes = 0
+        self._published = 0.0
+
+    def update(self, current: int, total: int) -> bool:
+        """
+        Records a progress callback. Returns True when the status text is
+        due for a refresh.
+        """
+        now = time.monotonic()
+        self.current = current
+        self.total = total
+        elapsed = now - self._sample_time
+        if elapsed >= SAMPLE_INTERVAL:
+            sample = (current - self._sample_bytes) / elapsed
+            self.speed = sample if not self.speed else SPEED_ALPHA * sample + (1 - SPEED_ALPHA) * self.speed
+            self._sample_time = now
+            self._sample_bytes = current
+        if current >= total or now - self._published >= PUBLISH_INTERVAL:
+            self._published = now
+            return True
+        return False
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def percentage(self) -> float:
+        return self.current * 100 / self.total if self.total else 0.0
+
+    @property
+    def eta(self) -> float:
+        if self.speed <= 0:
+            return 0.0
+        return max(self.total - self.current, 0) / self.speed
+
+    def snapshot(self) -> Dict:
+        return {
+            'user_id': self.user_id, 'status': self.status,
+            'current': self.current, 'total': self.total,
+            'speed': self.speed, 'eta': self.eta, 'elapsed': self.elapsed
+        }
+
+# ==============================================================================
+# 📡 IN-MEMORY PROGRESS BUS
+# Transfers publish their latest status text here; one renderer task per chat
+# edits the status messages, and only when the text actually changed. No
+# status files, no per-transfer polling tasks.
+# ==============================================================================
+class ProgressBus:
+    """
+    Latest status text per status message, grouped by chat.
+
+    `publish()` may be called from Pyrogram's progress executor threads; it
+    only swaps a string in a dict. Renderer tasks are started by `track()`,
+    which must run on the event loop.
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        # chat_id -> {message_id: [latest text, last rendered text]}
+        self._chats: Dict[int, Dict[int, list]] = {}
+        self._renderers: Dict[int, asyncio.Task] = {}
+        self._active: Dict[Tuple[int, int], TransferTracker] = {}
+
+    def track(self, client: Client, status: Message, user_id: int) -> TransferTracker:
+        """
+        Starts rendering updates for a status message and returns the
+        tracker the transfer reports its progress to.
+        """
+        chat_id = status.chat.id
+        self._chats.setdefault(chat_id, {})[status.id] = [None, None]
+        tracker = TransferTracker((chat_id, status.id), user_id)
+        self._active[tracker.key] = tracker
+        task = self._renderers.get(chat_id)
+        if task is None or task.done():
+            self._renderers[chat_id] = asyncio.create_task(self._render(client, chat_id))
+        return tracker
+
+    def untrack(self, tracker: Optional[TransferTracker]) -> None:
+        """
+        Stops rendering a tracker's status message and forgets its numbers.
+        The chat's renderer exits once it has nothing left to render.
+        """
+        if tracker is None:
+            return
+        self._active.pop(tracker.key, None)
+        trackers = self._chats.get(tracker.key[0])
+        if trackers:
+            trackers.pop(tracker.key[1], None)
+
+    def transfers(self, user_id: Optional[int] = None) -> list:
+        """
+        Snapshots of the live transfers, optionally for one user.
+        """
+        return [
+            t.snapshot() for t in list(self._active.values())
+            if user_id is None or t.user_id == user_id
+        ]
+
+    def stats(self) -> Dict:
+        """
+        Number of live transfers and their combined throughput (bytes/s).
+        """
+        active = list(self._active.values())
+        return {'active': len(active), 'speed': sum(t.speed for t in active)}
+
+    def publish(self, key: Tuple[int, int], text: str) -> None:
+        """
+        Records the latest text for a tracked (chat_id, message_id).
+        """
+        trackers = self._chats.get(key[0])
+        if trackers is None:
+            return
+        entry = trackers.get(key[1])
+        if entry is not None:
+            entry[0] = text
+
+    async def _render(self, client: Client, chat_id: int) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            trackers = self._chats.get(chat_id)
+            if not trackers:
+                self._chats.pop(chat_id, None)
+                self._renderers.pop(chat_id, None)
+                return
+            for message_id, entry in list(trackers.items()):
+                text, rendered = entry
+                if text is None or text == rendered:
+                    continue
+                try:
+                    await client.edit_message_text(chat_id, message_id, text, parse_mode=enums.ParseMode.HTML)
+                    entry[1] = text
+                except MessageNotModified:
+                    entry[1] = text
+                except FloodWait as e:
+                    await asyncio.sleep(e.value)
+                except Exception as e:
+                    logger.error(f"Progress render error in {chat_id}: {e}")
+
+
+progress_bus = ProgressBus(PROGRESS_EDIT_INTERVAL)
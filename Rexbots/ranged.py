@@ -0,0 +1,169 @@
+# Rexbots
+# Don't Remove Credit
+# Telegram Channel @RexBots_Official
+
+import asyncio
+import math
+import os
+import time
+from typing import Callable, Optional
+
+from pyrogram import Client
+from pyrogram.types import Message
+
+from config import RANGED_MIN_SIZE, RANGED_PART_CHUNKS, RANGED_MIN_WORKERS, RANGED_MAX_WORKERS
+from logger import LOGGER
+from Rexbots.retry import transfer_retry, is_cancel, refresh_message
+
+logger = LOGGER(__name__)
+
+CHUNK_SIZE = 1024 * 1024  # stream_media yields (and offsets by) 1 MiB chunks
+GROWTH_THRESHOLD = 1.10   # Add a worker only while throughput still grows 10%+
+
+# ==============================================================================
+# 🧵 PARALLEL RANGED DOWNLOADER
+# Splits a file into ranges of RANGED_PART_CHUNKS MiB and fetches them
+# concurrently with stream_media(offset, limit), writing every chunk at its
+# offset in a preallocated file. The worker count starts low and grows while
+# the measured throughput keeps improving. Files below RANGED_MIN_SIZE use a
+# single worker but still resume a failed range from its last written chunk.
+# ==============================================================================
+class RangedCancelled(Exception):
+    pass
+
+
+class RangedDownload:
+    """
+    One file being fetched in parallel ranges.
+    """
+    def __init__(
+        self,
+        acc: Client,
+        msg: Message,
+        file_size: int,
+        path: str,
+        progress: Optional[Callable[[int, int], None]] = None,
+        is_cancelled: Callable[[], bool] = lambda: False
+    ):
+        self.acc = acc
+        self.msg = msg
+        self.file_size = file_size
+        self.path = path
+        self.progress = progress
+        self.is_cancelled = is_cancelled
+        self.total_chunks = int(math.ceil(file_size / CHUNK_SIZE))
+        self.ranges: asyncio.Queue = asyncio.Queue()
+        self.done_bytes = 0
+        self.workers = []
+        parallel = file_size >= RANGED_MIN_SIZE
+        self.min_workers = RANGED_MIN_WORKERS if parallel else 1
+        self.max_workers = RANGED_MAX_WORKERS if parallel else 1
+        self._fd = None
+        self._best_speed = 0.0
+        self._growing = True
+        self._window_start = 0.0
+        self._window_bytes = 0
+
+    async def run(self) -> str:
+        for start in range(0, self.total_chunks, RANGED_PART_CHUNKS):
+            self.ranges.put_nowait((start, min(RANGED_PART_CHUNKS, self.total_chunks - start)))
+
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            await asyncio.to_thread(os.ftruncate, self._fd, self.file_size)  # Preallocate
+            self._window_start = time.monotonic()
+            for _ in range(min(self.min_workers, self.ranges.qsize())):
+                self._spawn()
+            # Workers may be added while we wait, so drain the list as it grows
+            while self.workers:
+                done, _ = await asyncio.wait(self.workers, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    self.workers.remove(task)
+                    if task.exception():
+                        raise task.exception()
+        except BaseException:
+            for task in self.workers:
+                task.cancel()
+            raise
+        finally:
+            os.close(self._fd)
+
+        if self.done_bytes != self.file_size:
+            raise ValueError(f"Ranged download incomplete ({self.done_bytes} of {self.file_size} bytes)")
+        return self.path
+
+    def _spawn(self) -> None:
+        self.workers.append(asyncio.create_task(self._worker()))
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                start, count = self.ranges.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await self._fetch_range(start, count)
+            self._adapt()
+
+    async def _fetch_range(self, start: int, count: int) -> None:
+        fetched = 0
+        attempt = 0
+        while fetched < count:
+            try:
+                async for chunk in self.acc.stream_media(self.msg, limit=count - fetched, offset=start + fetched):
+                    if self.is_cancelled():
+                        raise RangedCancelled("Cancelled")
+                    await asyncio.to_thread(os.pwrite, self._fd, chunk, (start + fetched) * CHUNK_SIZE)
+                    fetched += 1
+                    self.done_bytes += len(chunk)
+                    self._window_bytes += len(chunk)
+                    if self.progress:
+                        self.progress(self.done_bytes, self.file_size)
+                if fetched < count:
+                    raise ValueError(f"stream ended at chunk {start + fetched}")
+            except RangedCancelled:
+                raise
+            except Exception as e:
+                if is_cancel(e):  # Raised by the progress callback on /cancel
+                    raise
+                attempt += 1
+                if attempt >= transfer_retry.attempts:
+                    raise
+                logger.warning(f"Range {start}+{fetched}/{count} failed ({e}), retry {attempt}/{transfer_retry.attempts - 1}")
+                await transfer_retry.backoff(attempt, e)
+                # Expired file references surface as errors or short streams; renew before resuming
+                self.msg = await refresh_message(self.acc, self.msg)
+
+    def _adapt(self) -> None:
+        """
+        Hill-climbs the worker count: after each finished range, add a worker
+        if throughput rose noticeably since the last step, otherwise stop growing.
+        """
+        if not self._growing or len(self.workers) >= self.max_workers or self.ranges.empty():
+            return
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed <= 0:
+            return
+        speed = self._window_bytes / elapsed
+        self._window_start, self._window_bytes = now, 0
+        if speed >= self._best_speed * GROWTH_THRESHOLD:
+            self._best_speed = speed
+            self._spawn()
+        else:
+            self._growing = False
+            logger.info(f"Ranged download settled at {len(self.workers)} workers ({speed / CHUNK_SIZE:.1f} MiB/s)")
+
+
+async def download_ranged(
+    acc: Client,
+    msg: Message,
+    file_size: int,
+    path: str,
+    progress: Optional[Callable[[int, int], None]] = None,
+    is_cancelled: Callable[[], bool] = lambda: False
+) -> str:
+    """
+    Downloads `msg`'s media to `path` in parallel ranges and returns the path.
+    Raises on failure; a cancel raises RangedCancelled.
+    """
+    return await RangedDownload(acc, msg, file_size, path, progress, is_cancelled).run()
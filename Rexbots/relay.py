@@ -0,0 +1,280 @@
+# Rexbots
+# Don't Remove Credit
+# Telegram Channel @RexBots_Official
+
+import asyncio
+import math
+from hashlib import md5
+from typing import AsyncIterator, Awaitable, Callable, Optional, Tuple
+
+from pyrogram import Client, raw, types, utils
+from pyrogram.session import Session
+from pyrogram.types import Message
+
+from config import RELAY_BUFFER_CHUNKS, UPLOAD_PARALLEL_PARTS, UPLOAD_SESSIONS
+from logger import LOGGER
+from Rexbots.retry import transfer_retry
+
+logger = LOGGER(__name__)
+
+PART_SIZE = 512 * 1024              # Telegram upload part size
+BIG_FILE_THRESHOLD = 10 * 1024 * 1024  # Files above this use SaveBigFilePart
+
+# ==============================================================================
+# 🔁 ZERO-DISK STREAMING RELAY
+# Chunks streamed by the user session are fed straight into the bot's chunked
+# upload through a bounded in-memory buffer. Nothing touches the disk, and at
+# most RELAY_BUFFER_CHUNKS MiB are held in memory per transfer. The same
+# concurrent part uploader also sends files from the disk spool.
+# ==============================================================================
+class RelayCancelled(Exception):
+    pass
+
+
+async def open_media_session(client: Client) -> Session:
+    """
+    Starts a dedicated media session on the client's home DC for uploads,
+    the same way Pyrogram's own save_file does.
+    """
+    session = Session(
+        client, await client.storage.dc_id(), await client.storage.auth_key(),
+        await client.storage.test_mode(), is_media=True
+    )
+    await session.start()
+    return session
+
+
+async def _produce(acc: Client, msg: Message, buffer: asyncio.Queue, is_cancelled: Callable[[], bool]) -> None:
+    try:
+        async for chunk in acc.stream_media(msg):
+            if is_cancelled():
+                raise RelayCancelled("Cancelled")
+            await buffer.put(chunk)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        await buffer.put(None)  # Wake the uploader so it can fail fast
+        raise
+    await buffer.put(None)
+
+
+async def _iter_parts(buffer: asyncio.Queue) -> AsyncIterator[bytes]:
+    """
+    Re-slices the streamed chunks into fixed-size upload parts.
+    """
+    pending = bytearray()
+    while True:
+        chunk = await buffer.get()
+        if chunk is None:
+            break
+        pending.extend(chunk)
+        while len(pending) >= PART_SIZE:
+            yield bytes(pending[:PART_SIZE])
+            del pending[:PART_SIZE]
+    if pending:
+        yield bytes(pending)
+
+
+async def iter_file_parts(path: str) -> AsyncIterator[bytes]:
+    """
+    Reads a file on disk as upload parts without blocking the event loop.
+    """
+    with open(path, "rb") as f:
+        while True:
+            part = await asyncio.to_thread(f.read, PART_SIZE)
+            if not part:
+                break
+            yield part
+
+
+async def _save_part(session: Session, file_id: int, part_no: int, total_parts: int, part: bytes, is_big: bool) -> None:
+    """
+    Uploads one part, retrying only this part on failure.
+    """
+    if is_big:
+        rpc = raw.functions.upload.SaveBigFilePart(
+            file_id=file_id, file_part=part_no, file_total_parts=total_parts, bytes=part
+        )
+    else:
+        rpc = raw.functions.upload.SaveFilePart(file_id=file_id, file_part=part_no, bytes=part)
+    for attempt in range(1, transfer_retry.attempts + 1):
+        try:
+            await session.invoke(rpc)
+            return
+        except Exception as e:
+            if attempt == transfer_retry.attempts:
+                raise
+            logger.warning(f"Upload part {part_no} failed ({e}), retry {attempt}/{transfer_retry.attempts - 1}")
+            await transfer_retry.backoff(attempt, e)
+
+
+async def upload_stream(
+    client: Client,
+    parts: AsyncIterator[bytes],
+    file_size: int,
+    file_name: str,
+    progress: Optional[Callable[[int, int], None]] = None,
+    checkpoint: Optional[dict] = None
+):
+    """
+    Uploads parts as they arrive, UPLOAD_PARALLEL_PARTS at a time, and
+    returns the InputFile for SendMedia. Big files spread their parts over
+    UPLOAD_SESSIONS media sessions.
+
+    Passing the same `checkpoint` dict to a retry resumes the upload: the
+    file_id is kept and parts Telegram already stored are skipped.
+    """
+    if checkpoint is None:
+        checkpoint = {}
+    file_id = checkpoint.setdefault("file_id", client.rnd_id())
+    done_parts = checkpoint.setdefault("done", set())
+    total_parts = int(math.ceil(file_size / PART_SIZE))
+    is_big = file_size > BIG_FILE_THRESHOLD
+    md5_sum = md5() if not is_big else None
+    sessions = [await open_media_session(client) for _ in range(max(UPLOAD_SESSIONS, 1) if is_big else 1)]
+    inflight = asyncio.Queue(maxsize=max(UPLOAD_PARALLEL_PARTS, 1))
+    state = {"sent": len(done_parts) * PART_SIZE, "error": None}
+
+    async def worker(session: Session):
+        while True:
+            item = await inflight.get()
+            if item is None:
+                return
+            if state["error"]:
+                continue  # Drain so the reader never blocks on a dead upload
+            part_no, part = item
+            try:
+                await _save_part(session, file_id, part_no, total_parts, part, is_big)
+                done_parts.add(part_no)
+                state["sent"] += len(part)
+                if progress:
+                    progress(min(state["sent"], file_size), file_size)
+            except Exception as e:
+                state["error"] = e
+
+    workers = [
+        asyncio.create_task(worker(sessions[i % len(sessions)]))
+        for i in range(max(UPLOAD_PARALLEL_PARTS, 1))
+    ]
+    part_no = 0
+    try:
+        async for part in parts:
+            if state["error"]:
+                break
+            if md5_sum:
+                md5_sum.update(part)
+            if part_no not in done_parts:
+                await inflight.put((part_no, part))
+            part_no += 1
+        for _ in workers:
+            await inflight.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+        for session in sessions:
+            await session.stop()
+
+    if state["error"]:
+        raise state["error"]
+    if part_no != total_parts:
+        raise ValueError(f"Upload stream ended early ({state['sent']} of {file_size} bytes)")
+    if is_big:
+        return raw.types.InputFileBig(id=file_id, parts=total_parts, name=file_name)
+    return raw.types.InputFile(id=file_id, parts=total_parts, name=file_name, md5_checksum=md5_sum.hexdigest())
+
+
+def build_attributes(msg_type: str, media, file_name: str) -> list:
+    """
+    Document attributes that make Telegram render the file like the source.
+    """
+    attributes = [raw.types.DocumentAttributeFilename(file_name=file_name)]
+    if msg_type == "Video":
+        attributes.insert(0, raw.types.DocumentAttributeVideo(
+            supports_streaming=True,
+            duration=media.duration or 0,
+            w=media.width or 0,
+            h=media.height or 0
+        ))
+    elif msg_type == "Audio":
+        attributes.insert(0, raw.types.DocumentAttributeAudio(
+            duration=media.duration or 0,
+            performer=media.performer,
+            title=media.title
+        ))
+    return attributes
+
+
+async def send_uploaded_media(
+    client: Client,
+    chat_id: int,
+    input_file,
+    msg_type: str,
+    media,
+    file_name: str,
+    thumb: Optional[str],
+    caption: Optional[str]
+) -> Optional[Message]:
+    """
+    Sends an already uploaded InputFile as a document/video/audio message.
+    """
+    input_media = raw.types.InputMediaUploadedDocument(
+        mime_type=getattr(media, "mime_type", None) or "application/octet-stream",
+        file=input_file,
+        force_file=True if msg_type == "Document" else None,
+        thumb=await client.save_file(thumb) if thumb else None,
+        attributes=build_attributes(msg_type, media, file_name)
+    )
+    r = await client.invoke(
+        raw.functions.messages.SendMedia(
+            peer=await client.resolve_peer(chat_id),
+            media=input_media,
+            random_id=client.rnd_id(),
+            **await utils.parse_text_entities(client, caption or "", None, None)
+        )
+    )
+    for update in r.updates:
+        if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+            return await types.Message._parse(
+                client, update.message,
+                {u.id: u for u in r.users},
+                {c.id: c for c in r.chats}
+            )
+    return None
+
+
+async def relay_media(
+    client: Client,
+    acc: Client,
+    chat_id: int,
+    msg: Message,
+    msg_type: str,
+    file_size: int,
+    file_name: str,
+    meta: Callable[[], Awaitable[Tuple[Optional[str], Optional[str]]]],
+    progress: Optional[Callable[[int, int], None]] = None,
+    is_cancelled: Callable[[], bool] = lambda: False
+) -> Optional[Message]:
+    """
+    Streams `msg`'s media from the user session into a bot upload without
+    touching the disk. `meta()` resolves to (thumbnail path, caption) and is
+    awaited only after the file parts are uploaded, so it overlaps the relay.
+    Raises on failure; the caller falls back to the disk path.
+    """
+    media = getattr(msg, msg_type.lower())
+    buffer = asyncio.Queue(maxsize=max(RELAY_BUFFER_CHUNKS, 1))
+    producer = asyncio.create_task(_produce(acc, msg, buffer, is_cancelled))
+    try:
+        try:
+            input_file = await upload_stream(client, _iter_parts(buffer), file_size, file_name, progress)
+        except Exception:
+            # Prefer the download-side error, it is usually the root cause
+            if producer.done() and not producer.cancelled() and producer.exception():
+                raise producer.exception()
+            raise
+        await producer
+    finally:
+        if not producer.done():
+            producer.cancel()
+    thumb, caption = await meta()
+    return await send_uploaded_media(client, chat_id, input_file, msg_type, media, file_name, thumb, caption)
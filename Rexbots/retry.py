@@ -0,0 +1,67 @@
+# Rexbots
+# Don't Remove Credit
+# Telegram Channel @RexBots_Official
+
+import asyncio
+import random
+from typing import Optional
+
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+from pyrogram.types import Message
+
+from config import TRANSFER_RETRIES, TRANSFER_RETRY_BASE, TRANSFER_RETRY_MAX
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+# ==============================================================================
+# 🔄 TRANSFER RETRY POLICY
+# Shared by the downloader and uploader: exponential backoff with full jitter,
+# so transfers that failed together do not retry in lockstep, and FloodWait
+# is always honoured for exactly as long as Telegram asks.
+# ==============================================================================
+class RetryPolicy:
+    """
+    How often and how long to wait before retrying a failed transfer step.
+    """
+    def __init__(self, attempts: int, base_delay: float, max_delay: float):
+        self.attempts = max(attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """
+        Full-jitter backoff for the given 1-based attempt.
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    async def backoff(self, attempt: int, error: Optional[Exception] = None) -> None:
+        if isinstance(error, FloodWait):
+            await asyncio.sleep(error.value)
+        else:
+            await asyncio.sleep(self.delay(attempt))
+
+
+def is_cancel(error: Exception) -> bool:
+    """
+    True for the user's /cancel, which must never be retried.
+    """
+    return "Cancelled" in str(error)
+
+
+async def refresh_message(acc: Client, msg: Message) -> Message:
+    """
+    Re-fetches a source message so its media carries a fresh file reference.
+    Falls back to the old message if the fetch fails.
+    """
+    try:
+        fresh = await acc.get_messages(msg.chat.id, msg.id)
+        if fresh and not fresh.empty:
+            return fresh
+    except Exception as e:
+        logger.warning(f"Could not refresh message {msg.chat.id}:{msg.id}: {e}")
+    return msg
+
+
+transfer_retry = RetryPolicy(TRANSFER_RETRIES, TRANSFER_RETRY_BASE, TRANSFER_RETRY_MAX)
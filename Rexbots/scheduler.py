@@ -0,0 +1,177 @@
+# Rexbots
+# Don't Remove Credit
+# Telegram Channel @RexBots_Official
+
+import asyncio
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Dict, Optional
+
+from config import SCHEDULER_MAX_ACTIVE, SCHEDULER_PER_USER, SCHEDULER_PER_USER_PREMIUM, SCHEDULER_PREMIUM_WEIGHT
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+PREMIUM, FREE = "premium", "free"
+
+# ==============================================================================
+# 🚦 GLOBAL TRANSFER SCHEDULER
+# Message handlers only enqueue batches here. Batches start under a global
+# cap and a per-user cap; within each lane users take turns (round-robin), so
+# one huge batch cannot hold back everyone else. The premium lane is served
+# first, but every SCHEDULER_PREMIUM_WEIGHT premium starts let one waiting
+# free batch through so the free lane never starves.
+# ==============================================================================
+class BatchRequest:
+    """
+    One queued batch. `run()` performs the whole batch.
+    """
+    __slots__ = ("user_id", "lane", "run")
+
+    def __init__(self, user_id: int, lane: str, run: Callable[[], Awaitable[None]]):
+        self.user_id = user_id
+        self.lane = lane
+        self.run = run
+
+
+class TransferScheduler:
+    """
+    Fair admission control for batches.
+
+    `cancel_flags` maps user_id -> True while that user's cancel is
+    draining; the user's next batch starts only after their running
+    batches have stopped, and the flag is cleared then.
+    """
+    def __init__(self, max_active: int, per_user: int, per_user_premium: int, premium_weight: int):
+        self.max_active = max(max_active, 1)
+        self.per_user = {FREE: max(per_user, 1), PREMIUM: max(per_user_premium, 1)}
+        self.premium_weight = max(premium_weight, 1)
+        # lane -> user_id -> pending requests (OrderedDict order = turn order)
+        self._lanes: Dict[str, "OrderedDict[int, deque]"] = {PREMIUM: OrderedDict(), FREE: OrderedDict()}
+        self._running: Dict[int, int] = {}
+        self._tasks = set()
+        self._premium_streak = 0
+        self.cancel_flags: Dict[int, bool] = {}
+
+    @property
+    def active(self) -> int:
+        return sum(self._running.values())
+
+    def running(self, user_id: int) -> int:
+        return self._running.get(user_id, 0)
+
+    def queued(self, user_id: Optional[int] = None) -> int:
+        return sum(
+            len(pending)
+            for lane in self._lanes.values()
+            for uid, pending in lane.items()
+            if user_id is None or uid == user_id
+        )
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Running batches, queued batches per lane and the global cap.
+        """
+        return {
+            'active': self.active,
+            'premium_queued': sum(len(p) for p in self._lanes[PREMIUM].values()),
+            'free_queued': sum(len(p) for p in self._lanes[FREE].values()),
+            'max_active': self.max_active
+        }
+
+    def submit(self, user_id: int, premium: bool, run: Callable[[], Awaitable[None]]) -> int:
+        """
+        Enqueues a batch and starts whatever may start now. Returns the
+        batch's queue position (1 = next), or 0 if it started right away.
+        """
+        request = BatchRequest(user_id, PREMIUM if premium else FREE, run)
+        self._lanes[request.lane].setdefault(user_id, deque()).append(request)
+        self._dispatch()
+        return self.position(request)
+
+    def cancel(self, user_id: int) -> int:
+        """
+        Drops the user's queued batches and flags the running ones to stop.
+        Returns how many queued batches were dropped.
+        """
+        dropped = 0
+        for lane in self._lanes.values():
+            pending = lane.pop(user_id, None)
+            if pending:
+                dropped += len(pending)
+        if self.running(user_id):
+            self.cancel_flags[user_id] = True
+        return dropped
+
+    def position(self, request: BatchRequest) -> int:
+        """
+        1-based position in the order batches would start if no slot frees
+        out of turn; 0 once the batch is no longer queued.
+        """
+        ahead = 0
+        if request.lane == FREE:
+            ahead = sum(len(p) for p in self._lanes[PREMIUM].values())
+        lane = self._lanes[request.lane]
+        rounds = max((len(p) for p in lane.values()), default=0)
+        for turn in range(rounds):
+            for pending in lane.values():
+                if turn < len(pending):
+                    if pending[turn] is request:
+                        return ahead + 1
+                    ahead += 1
+        return 0
+
+    def _eligible(self, user_id: int, lane: str) -> bool:
+        if self.cancel_flags.get(user_id):
+            return False
+        return self.running(user_id) < self.per_user[lane]
+
+    def _next_from(self, lane_name: str) -> Optional[BatchRequest]:
+        lane = self._lanes[lane_name]
+        for user_id in list(lane):
+            if not self._eligible(user_id, lane_name):
+                continue
+            pending = lane.pop(user_id)
+            request = pending.popleft()
+            if pending:
+                lane[user_id] = pending  # Re-insert at the back: next user's turn
+            return request
+        return None
+
+    def _next(self) -> Optional[BatchRequest]:
+        free_first = self._premium_streak >= self.premium_weight
+        order = (FREE, PREMIUM) if free_first else (PREMIUM, FREE)
+        for lane in order:
+            request = self._next_from(lane)
+            if request:
+                self._premium_streak = self._premium_streak + 1 if lane == PREMIUM else 0
+                return request
+        return None
+
+    def _dispatch(self) -> None:
+        while self.active < self.max_active:
+            request = self._next()
+            if request is None:
+                return
+            self._running[request.user_id] = self.running(request.user_id) + 1
+            task = asyncio.create_task(self._run(request))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, request: BatchRequest) -> None:
+        try:
+            await request.run()
+        except Exception as e:
+            logger.error(f"Scheduler: batch for {request.user_id} failed: {e}")
+        finally:
+            left = self.running(request.user_id) - 1
+            if left > 0:
+                self._running[request.user_id] = left
+            else:
+                self._running.pop(request.user_id, None)
+                self.cancel_flags.pop(request.user_id, None)
+            self._dispatch()
+
+
+transfer_scheduler = TransferScheduler(
+    SCHEDULER_MAX_ACTIVE, SCHEDULER_PER_USER, SCHEDULER_PER_USER_PREMIUM, SCHEDULER_PREMIUM_WEIGHT
+)
@@ -13,6 +13,7 @@ from pyrogram.errors import (
 from pyrogram import enums
 from config import API_ID, API_HASH
 from database.db import db
+from Rexbots.session_pool import session_pool
 
 # ==========================================
 # STATE MANAGEMENT
@@ -148,8 +149,9 @@ async def logout(client: Client, message: Message):
     if user_id in LOGIN_STATE:
         del LOGIN_STATE[user_id]
     
-    # Remove from Database
+    # Remove from Database and drop pooled connections for the old session
     await db.set_session(user_id, session=None)
+    await session_pool.discard(user_id)
     await message.reply(
         "<b>🚪 Logout Successful! 👋</b>\n\n"
         "<i>Your session has been cleared. You can log in again anytime! 🔄</i>",
@@ -180,7 +182,8 @@ async def cancel_login(client: Client, message: Message):
             reply_markup=remove_keyboard
         )
     else:
-        pass
+        # Not logging in: let /cancel reach the batch cancel handler
+        message.continue_propagation()
 
 # ---------------------------------------------------
 # FILTER: Check if user is in Login State
@@ -0,0 +1,249 @@
+# Rexbots
+# Don't Remove Credit
+# Telegram Channel @RexBots_Official
+
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+from pyrogram import Client
+
+from config import API_ID, API_HASH, SESSION_POOL_MAX, SESSION_POOL_PER_USER, SESSION_POOL_TTL
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+# ==============================================================================
+# 🔌 USER SESSION POOL
+# Keeps connected user clients alive between messages so a batch reuses one
+# MTProto connection instead of opening (and leaking) one per message id.
+# ==============================================================================
+class PooledSession:
+    """
+    A connected user client together with its pool bookkeeping.
+    """
+    def __init__(self, user_id: int, session_string: str, client: Client):
+        self.user_id = user_id
+        self.session_string = session_string
+        self.client = client
+        self.in_use = 0
+        self.last_used = time.monotonic()
+        self.retired = False
+        self.connected = asyncio.Event()  # Set once connect() finished (see `failed`)
+        self.failed = False
+
+
+class SessionPool:
+    """
+    Hands out already-connected user clients keyed by user id.
+
+    - At most `per_user` connections are opened for one user; extra borrowers
+      share the least busy client (Pyrogram clients are safe to share).
+    - At most `max_clients` connections exist in total; the least recently used
+      idle client is evicted to make room, otherwise borrowers wait.
+    - Idle clients older than `ttl` seconds are disconnected by a reaper task.
+    """
+    def __init__(self, max_clients: int, per_user: int, ttl: int):
+        self.max_clients = max_clients
+        self.per_user = per_user
+        self.ttl = ttl
+        # user_id -> sessions, ordered from least to most recently used user
+        self._sessions: "OrderedDict[int, List[PooledSession]]" = OrderedDict()
+        self._cond: Optional[asyncio.Condition] = None
+        self._reaper: Optional[asyncio.Task] = None
+        self._counter = 0
+
+    @property
+    def size(self) -> int:
+        return sum(len(entries) for entries in self._sessions.values())
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns pool occupancy numbers.
+        """
+        entries = [e for user_entries in self._sessions.values() for e in user_entries]
+        return {
+            'users': len(self._sessions),
+            'clients': len(entries),
+            'busy': sum(1 for e in entries if e.in_use),
+        }
+
+    def _condition(self) -> asyncio.Condition:
+        # Created lazily so the pool can be built at import time
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_idle())
+        return self._cond
+
+    @asynccontextmanager
+    async def acquire(self, user_id: int, session_string: str):
+        """
+        Borrows a connected client for the user.
+        Usage: async with session_pool.acquire(user_id, session) as acc: ...
+        """
+        entry = await self._checkout(user_id, session_string)
+        try:
+            yield entry.client
+        finally:
+            await self._checkin(entry)
+
+    async def _checkout(self, user_id: int, session_string: str) -> PooledSession:
+        while True:
+            entry, created = await self._reserve(user_id, session_string)
+            if created:
+                await self._connect(entry)
+                return entry
+            # A shared client may still be connecting for another borrower
+            try:
+                await entry.connected.wait()
+            except BaseException:
+                await self._checkin(entry)
+                raise
+            if not entry.failed:
+                return entry
+            # Its connect failed and it left the pool; pick again
+
+    async def _reserve(self, user_id: int, session_string: str) -> Tuple[PooledSession, bool]:
+        """
+        Lends an existing client or reserves a slot for a new one.
+        Returns (entry, created); created entries still need _connect().
+        """
+        cond = self._condition()
+        async with cond:
+            while True:
+                entries = self._sessions.get(user_id, [])
+
+                # A re-login changes the session string; drop stale idle clients
+                for stale in [e for e in entries if e.session_string != session_string and not e.in_use]:
+                    self._remove(stale)
+                    asyncio.create_task(self._disconnect(stale))
+                current = [e for e in entries if e.session_string == session_string]
+
+                idle = [e for e in current if not e.in_use]
+                if idle:
+                    return self._lend(idle[0]), False
+
+                if len(current) < self.per_user:
+                    if self.size < self.max_clients or self._evict_lru():
+                        break
+
+                if current:
+                    # Per-user cap reached: share the least busy connection
+                    return self._lend(min(current, key=lambda e: e.in_use)), False
+
+                await cond.wait()
+
+            # Reserve the slot before connecting so concurrent borrowers see it
+            self._counter += 1
+            client = Client(
+                f"pool_{user_id}_{self._counter}",
+                session_string=session_string,
+                api_hash=API_HASH,
+                api_id=API_ID,
+                in_memory=True,
+                max_concurrent_transmissions=20
+            )
+            entry = PooledSession(user_id, session_string, client)
+            entry.in_use = 1
+            self._sessions.setdefault(user_id, []).append(entry)
+            self._sessions.move_to_end(user_id)
+            return entry, True
+
+    async def _connect(self, entry: PooledSession) -> None:
+        try:
+            await entry.client.connect()
+        except BaseException:
+            # Cancellation too: waiters must not adopt a half-connected client
+            entry.failed = True
+            cond = self._condition()
+            async with cond:
+                self._remove(entry)
+                cond.notify_all()
+            raise
+        finally:
+            entry.connected.set()  # Wake borrowers sharing this entry
+        logger.info(f"Session pool: connected client for user {entry.user_id} ({self.size}/{self.max_clients})")
+
+    def _lend(self, entry: PooledSession) -> PooledSession:
+        entry.in_use += 1
+        entry.last_used = time.monotonic()
+        self._sessions.move_to_end(entry.user_id)
+        return entry
+
+    async def _checkin(self, entry: PooledSession) -> None:
+        cond = self._condition()
+        async with cond:
+            entry.in_use -= 1
+            entry.last_used = time.monotonic()
+            cond.notify_all()
+        if entry.retired and not entry.in_use:
+            await self._disconnect(entry)
+
+    def _remove(self, entry: PooledSession) -> None:
+        entries = self._sessions.get(entry.user_id)
+        if entries and entry in entries:
+            entries.remove(entry)
+            if not entries:
+                del self._sessions[entry.user_id]
+
+    def _evict_lru(self) -> bool:
+        """
+        Drops the least recently used idle client. Returns False if all are busy.
+        """
+        for entries in self._sessions.values():
+            for entry in sorted(entries, key=lambda e: e.last_used):
+                if not entry.in_use:
+                    self._remove(entry)
+                    asyncio.create_task(self._disconnect(entry))
+                    return True
+        return False
+
+    async def _disconnect(self, entry: PooledSession) -> None:
+        try:
+            await entry.client.disconnect()
+        except Exception as e:
+            logger.warning(f"Session pool: error disconnecting user {entry.user_id}: {e}")
+
+    async def _reap_idle(self) -> None:
+        while True:
+            await asyncio.sleep(max(self.ttl // 4, 15))
+            now = time.monotonic()
+            expired = []
+            async with self._condition():
+                for entries in list(self._sessions.values()):
+                    for entry in list(entries):
+                        if not entry.in_use and now - entry.last_used > self.ttl:
+                            self._remove(entry)
+                            expired.append(entry)
+            for entry in expired:
+                await self._disconnect(entry)
+            if expired:
+                logger.info(f"Session pool: evicted {len(expired)} idle clients")
+
+    async def discard(self, user_id: int) -> None:
+        """
+        Disconnects every idle client of a user (e.g. after /logout).
+        Busy clients are dropped from the pool and closed once released.
+        """
+        entries = self._sessions.pop(user_id, [])
+        for entry in entries:
+            entry.retired = True
+            if not entry.in_use:
+                await self._disconnect(entry)
+
+    async def close(self) -> None:
+        """
+        Disconnects all pooled clients. Called on bot shutdown.
+        """
+        if self._reaper:
+            self._reaper.cancel()
+        users = list(self._sessions)
+        for user_id in users:
+            await self.discard(user_id)
+        logger.info("Session pool closed")
+
+
+session_pool = SessionPool(SESSION_POOL_MAX, SESSION_POOL_PER_USER, SESSION_POOL_TTL)
@@ -2,7 +2,9 @@ import os
 from pyrogram import Client, filters, enums
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from database.db import db
+from Rexbots.context import get_context
 from Rexbots.strings import COMMANDS_TXT
+from Rexbots.caption import compile_caption, render_compiled, SAMPLE_VALUES
 
 # ======================================================
 # /settings - Enhanced Professional Settings Menu
@@ -10,12 +12,9 @@ from Rexbots.strings import COMMANDS_TXT
 @Client.on_message(filters.command("settings") & filters.private)
 async def settings_menu(client: Client, message: Message):
     user_id = message.from_user.id
-    # Ensure user exists (Safe Call)
-    if not await db.is_user_exist(user_id):
-        await db.add_user(user_id, message.from_user.first_name)
 
     # Fetch real status
-    is_premium = await db.check_premium(user_id)
+    is_premium = (await get_context(message)).is_premium
     premium_badge = "💎 Premium Member" if is_premium else "👤 Free User"
 
     buttons = InlineKeyboardMarkup([
@@ -61,8 +60,6 @@ async def direct_commands(client: Client, message: Message):
 @Client.on_message(filters.command("setchat") & filters.private)
 async def set_dump_chat(client: Client, message: Message):
     user_id = message.from_user.id
-    if not await db.is_user_exist(user_id):
-        await db.add_user(user_id, message.from_user.first_name)
 
     if len(message.command) < 2:
         return await message.reply_text(
@@ -143,7 +140,7 @@ async def settings_callbacks(client: Client, callback_query: CallbackQuery):
         await callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(back_close), parse_mode=enums.ParseMode.HTML)
 
     elif data == "thumb_btn":
-        thumb = await db.get_thumbnail(user_id)
+        thumb = (await get_context(callback_query)).thumbnail
         if thumb and os.path.exists(thumb):
             await callback_query.message.reply_photo(
                 thumb,
@@ -160,36 +157,36 @@ async def settings_callbacks(client: Client, callback_query: CallbackQuery):
             )
 
     elif data == "caption_btn":
-        caption = await db.get_caption(user_id)
+        caption = (await get_context(callback_query)).caption
         if caption:
-            preview = caption.format(filename="Video_File_2024.mp4", size="1.2 GB")
+            preview = render_compiled(compile_caption(caption), SAMPLE_VALUES)
             text = (
                 f"<b>📝 Current Custom Caption</b>\n\n"
                 f"<code>{caption}</code>\n\n"
                 f"<b>Preview:</b>\n{preview}\n\n"
-                "<i>Placeholders: {filename}, {size}</i>\n"
+                "<i>Placeholders: {filename}, {size}, {date}, {caption}, {msg_id}, {chat_name}</i>\n"
                 "<i>/set_caption &lt;text&gt; to change • /del_caption to remove</i>"
             )
         else:
             text = (
                 "<b>📝 No Custom Caption Set</b>\n\n"
                 "<i>Use /set_caption &lt;text&gt; to set one.</i>\n"
-                "<i>Supports {filename} and {size} placeholders.</i>"
+                "<i>Supports {filename}, {size}, {date}, {caption}, {msg_id} and {chat_name}.</i>"
             )
         await callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(back_close), parse_mode=enums.ParseMode.HTML)
 
     elif data == "user_stats_btn":
-        # Fetch real stats from DB
-        is_premium = await db.check_premium(user_id)
-        user_data = await db.col.find_one({'id': int(user_id)})
+        # Real stats from the user context
+        ctx = await get_context(callback_query)
+        is_premium = ctx.is_premium
         
         if is_premium:
             limit_text = "♾️ Unlimited"
             usage_text = "Ignored (Premium)"
         else:
             # Free user logic
-            daily_limit = 10
-            used = user_data.get('daily_usage', 0)
+            daily_limit = ctx.daily_limit
+            used = ctx.daily_usage
             limit_text = f"{daily_limit} Files / 24h"
             usage_text = f"{used} / {daily_limit}"
 
@@ -204,7 +201,7 @@ async def settings_callbacks(client: Client, callback_query: CallbackQuery):
 
     elif data == "settings_back_btn":
         # Re-render main menu
-        is_premium = await db.check_premium(user_id)
+        is_premium = (await get_context(callback_query)).is_premium
         premium_badge = "💎 Premium Member" if is_premium else "👤 Free User"
         
         buttons = InlineKeyboardMarkup([
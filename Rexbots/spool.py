@@ -0,0 +1,148 @@
+# Rexbots
+# Don't Remove Credit
+# Telegram Channel @RexBots_Official
+
+import asyncio
+import os
+import shutil
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+from config import SPOOL_DIR, SPOOL_MAX_BYTES
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+# Headroom reserved next to every file for thumbnails and partial writes
+SPOOL_MARGIN = 2 * 1024 * 1024
+
+# ==============================================================================
+# 💽 DOWNLOAD SPOOL
+# Owns one root directory for all temporary transfer files and enforces a
+# total byte budget. Transfers reserve their announced size up front and
+# wait in line when the disk is full instead of failing every other job.
+# ==============================================================================
+class SpoolFull(Exception):
+    pass
+
+
+class SpoolEntry:
+    """
+    A reserved directory inside the spool.
+    """
+    def __init__(self, spool: "Spool", path: str, size: int):
+        self.spool = spool
+        self.path = path
+        self.size = size
+
+    async def release(self) -> None:
+        await self.spool.release(self)
+
+
+class Spool:
+    """
+    Admission control and cleanup for temporary transfer files.
+    """
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._active: Dict[str, SpoolEntry] = {}
+        self._reserved = 0
+        self._cond: Optional[asyncio.Condition] = None
+
+    @property
+    def reserved(self) -> int:
+        return self._reserved
+
+    def _condition(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the budget, reserved bytes and number of active entries.
+        """
+        return {'budget': self.max_bytes, 'reserved': self._reserved, 'active': len(self._active)}
+
+    async def reserve(self, size: int, on_wait: Optional[Callable] = None) -> SpoolEntry:
+        """
+        Reserves `size` bytes and returns a fresh directory for them.
+        Waits while the budget is exhausted; `on_wait()` is awaited once when
+        the transfer has to queue. Raises SpoolFull if it can never fit.
+        """
+        size = max(size, 0) + SPOOL_MARGIN
+        if size > self.max_bytes:
+            raise SpoolFull(f"File needs {size} bytes but the spool budget is {self.max_bytes}")
+
+        cond = self._condition()
+        waited = False
+        async with cond:
+            while self._reserved + size > self.max_bytes:
+                if not waited:
+                    waited = True
+                    if on_wait:
+                        await on_wait()
+                await cond.wait()
+
+            path = os.path.join(self.root, uuid.uuid4().hex)
+            entry = SpoolEntry(self, path, size)
+            self._active[path] = entry
+            self._reserved += size
+        os.makedirs(path, exist_ok=True)
+        return entry
+
+    async def release(self, entry: SpoolEntry) -> None:
+        """
+        Deletes the entry's files and returns its bytes to the budget.
+        """
+        await asyncio.to_thread(shutil.rmtree, entry.path, True)
+        cond = self._condition()
+        async with cond:
+            if self._active.pop(entry.path, None) is not None:
+                self._reserved -= entry.size
+            cond.notify_all()
+
+    def _reclaim_orphans(self) -> int:
+        """
+        Removes spool entries no live transfer owns, least recently used
+        first. Returns how many were removed.
+        """
+        if not os.path.isdir(self.root):
+            return 0
+        orphans = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if path in self._active:
+                continue
+            try:
+                orphans.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        orphans.sort()
+        removed = 0
+        for _, path in orphans:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+            removed += 1
+        return removed
+
+    async def reclaim_orphans(self) -> int:
+        """
+        Startup sweep: clears everything left behind by a previous process.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        started = time.monotonic()
+        removed = await asyncio.to_thread(self._reclaim_orphans)
+        if removed:
+            logger.info(f"Spool: reclaimed {removed} orphaned entries in {time.monotonic() - started:.1f}s")
+        return removed
+
+
+spool = Spool(SPOOL_DIR, SPOOL_MAX_BYTES)
@@ -2,7 +2,9 @@ import os
 import asyncio
 import random
 import time
-import shutil
+from hashlib import md5
+from collections import deque
+from contextlib import AsyncExitStack
 import requests  # Added for fetching random wallpapers from API
 import pyrogram
 from pyrogram import Client, filters, enums
@@ -10,9 +12,29 @@ from pyrogram.errors import (
     FloodWait, UserIsBlocked, InputUserDeactivated, UserAlreadyParticipant,
     InviteHashExpired, UsernameNotOccupied, AuthKeyUnregistered, UserDeactivated, UserDeactivatedBan
 )
-from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message, CallbackQuery, InputMediaPhoto
-from config import API_ID, API_HASH, ERROR_MESSAGE
+from pyrogram.types import (
+    InlineKeyboardMarkup, InlineKeyboardButton, Message, CallbackQuery,
+    InputMediaPhoto, InputMediaVideo, InputMediaDocument, InputMediaAudio
+)
+from config import (
+    PIPELINE_PREPARE_DEPTH, PIPELINE_DOWNLOAD_DEPTH, PIPELINE_UPLOAD_DEPTH, RELAY_MODE
+)
 from database.db import db
+from Rexbots.session_pool import session_pool
+from Rexbots.pipeline import Pipeline, Stage
+from Rexbots.planner import plan_range, group_albums
+from Rexbots.relay import relay_media, upload_stream, iter_file_parts, send_uploaded_media
+from Rexbots.ranged import download_ranged
+from Rexbots.retry import transfer_retry, is_cancel, refresh_message
+from Rexbots.spool import spool, SpoolFull
+from Rexbots.progress import progress_bus
+from Rexbots.thumbnail import thumb_cache
+from Rexbots.caption import caption_cache, render_compiled
+from Rexbots.words import word_cache
+from Rexbots.scheduler import transfer_scheduler
+from Rexbots.context import get_context
+from Rexbots.ledger import usage_ledger
+from Rexbots.stats import stats_snapshot
 import math
 from logger import LOGGER
 
@@ -51,7 +73,6 @@ SUBSCRIPTION = os.environ.get('SUBSCRIPTION', 'https://graph.org/file/242b7f1b52
 
 # --- Operational Limits ---
 FREE_LIMIT_SIZE = 2 * 1024 * 1024 * 1024  # 2 GB Limit for Free Users
-FREE_LIMIT_DAILY = 10  # 10 Files per 24h
 
 # --- Payment Info ---
 UPI_ID = os.environ.get("UPI_ID", "your_upi@oksbi")
@@ -199,7 +220,53 @@ def TimeFormatter(milliseconds: int) -> str:
     return tmp[:-2] if tmp else "0s"
 
 class batch_temp(object):
-    CANCEL_FLAGS = {}  # Renamed for clarity: True means cancel requested
+    CANCEL_FLAGS = transfer_scheduler.cancel_flags  # True while a cancel drains; cleared by the scheduler
+
+class BatchCheckpoint(object):
+    """
+    Resume point of one batch. Items are issued in range order as they enter
+    the pipeline and settled once delivered (or found undeliverable) at any
+    stage; the cursor is the highest msgid with nothing unsettled before it.
+    """
+    def __init__(self):
+        self.pending = deque()  # [last msgid of the item, settled]
+        self.cursor = None
+
+    def issue(self, msgids: list) -> list:
+        entry = [max(msgids), False]
+        self.pending.append(entry)
+        return entry
+
+    def settle(self, entry: list):
+        """Marks an item done. Returns the new cursor if it moved, else None."""
+        entry[1] = True
+        moved = False
+        while self.pending and self.pending[0][1]:
+            self.cursor = self.pending.popleft()[0]
+            moved = True
+        return self.cursor if moved else None
+
+class QuotaExhausted(Exception):
+    """Raised mid-batch when the user's daily quota refuses the next file."""
+
+async def take_quota(user_id: int):
+    """
+    Counts one file against the daily quota in a single atomic DB call.
+    Returns the quota window it was counted in, for db.refund_quota().
+    """
+    granted, _, window = await db.consume_quota(user_id)
+    if not granted:
+        raise QuotaExhausted()
+    return window
+
+async def send_limit_reached(message: Message):
+    btn = InlineKeyboardMarkup([[InlineKeyboardButton("💎 Upgrade to Premium", callback_data="buy_premium")]])
+    return await message.reply_photo(
+        photo=SUBSCRIPTION,
+        caption=script.LIMIT_REACHED,
+        reply_markup=btn,
+        parse_mode=enums.ParseMode.HTML
+    )
 
 def get_message_type(msg):
     """Determines the type of Telegram message."""
@@ -213,91 +280,37 @@ def get_message_type(msg):
 # ==============================================================================
 # 📊 PROGRESS BAR ENGINE (Upgraded with Status & Resume Support)
 # ==============================================================================
-async def downstatus(client, statusfile, message, chat):
-    """Monitors download status file and updates message."""
-    while not os.path.exists(statusfile):
-        await asyncio.sleep(3)
-    while os.path.exists(statusfile):
-        try:
-            with open(statusfile, "r", encoding='utf-8') as downread:
-                txt = downread.read()
-            await client.edit_message_text(chat, message.id, f"{txt}")
-            await asyncio.sleep(5)
-        except Exception as e:
-            logger.error(f"Downstatus error: {e}")
-            await asyncio.sleep(5)
-
-async def upstatus(client, statusfile, message, chat):
-    """Monitors upload status file and updates message."""
-    while not os.path.exists(statusfile):
-        await asyncio.sleep(3)
-    while os.path.exists(statusfile):
-        try:
-            with open(statusfile, "r", encoding='utf-8') as upread:
-                txt = upread.read()
-            await client.edit_message_text(chat, message.id, f"{txt}")
-            await asyncio.sleep(5)
-        except Exception as e:
-            logger.error(f"Upstatus error: {e}")
-            await asyncio.sleep(5)
-
-def progress(current, total, message, type, status="Processing"):
-    """Progress callback with enhanced bar and cancel check."""
-    if batch_temp.CANCEL_FLAGS.get(message.from_user.id):
+def progress(current, total, tracker):
+    """Progress callback: updates the transfer's tracker and publishes the bar when due."""
+    if batch_temp.CANCEL_FLAGS.get(tracker.user_id):
         raise Exception("Cancelled")
-    if not hasattr(progress, "cache"):
-        progress.cache = {}
-    
-    now = time.time()
-    task_id = f"{message.id}{type}"
-    last_time = progress.cache.get(task_id, 0)
-    
-    if not hasattr(progress, "start_time"):
-        progress.start_time = {}
-    if task_id not in progress.start_time:
-        progress.start_time[task_id] = now
+    if not tracker.update(current, total):
+        return
+    try:
+        # Upgraded Bar: 30 segments for ultra-smooth visualization
+        filled_length = int(tracker.percentage / (100 / 30))  # 30 segments
+        bar = '█' * filled_length + ' ' * (30 - filled_length)
         
-    if (now - last_time) > 5 or current == total:
-        try:
-            percentage = current * 100 / total
-            speed = current / (now - progress.start_time[task_id]) if (now - progress.start_time[task_id]) > 0 else 0
-            eta = (total - current) / speed if speed > 0 else 0
-            elapsed = now - progress.start_time[task_id]
-            
-            # Upgraded Bar: 30 segments for ultra-smooth visualization
-            filled_length = int(percentage / (100 / 30))  # 30 segments
-            bar = '█' * filled_length + ' ' * (30 - filled_length)
-            
-            status_text = script.PROGRESS_BAR.format(
-                bar=bar,
-                percentage=percentage,
-                current=humanbytes(current),
-                total=humanbytes(total),
-                speed=humanbytes(speed),
-                elapsed=TimeFormatter(elapsed * 1000),
-                eta=TimeFormatter(eta * 1000),
-                status=status
-            )
-            
-            with open(f'{message.id}{type}status.txt', "w", encoding='utf-8') as fileup:
-                fileup.write(status_text)
-                
-            progress.cache[task_id] = now
-            
-            if current == total:
-                progress.start_time.pop(task_id, None)
-                progress.cache.pop(task_id, None)
-        except Exception as e:
-            logger.error(f"Progress error: {e}")
+        status_text = script.PROGRESS_BAR.format(
+            bar=bar,
+            percentage=tracker.percentage,
+            current=humanbytes(current),
+            total=humanbytes(total),
+            speed=humanbytes(tracker.speed),
+            elapsed=TimeFormatter(tracker.elapsed * 1000),
+            eta=TimeFormatter(tracker.eta * 1000),
+            status=tracker.status
+        )
+        progress_bus.publish(tracker.key, status_text)
+    except Exception as e:
+        logger.error(f"Progress error: {e}")
 
 # ==============================================================================
 # 🎮 CORE COMMANDS (Enhanced with More Checks)
 # ==============================================================================
 @Client.on_message(filters.command(["start"]))
 async def send_start(client: Client, message: Message):
-    user_id = message.from_user.id
-    if not await db.is_user_exist(user_id):
-        await db.add_user(user_id, message.from_user.first_name)
+    await get_context(message)  # Registers the user if the middleware did not (e.g. groups)
     # Auto-Reaction
     try:
         await message.react(emoji=random.choice(REACTIONS), big=True)
@@ -355,23 +368,33 @@ async def send_plan(client: Client, message: Message):
 @Client.on_message(filters.command(["cancel"]))
 async def send_cancel(client: Client, message: Message):
     user_id = message.from_user.id
-    batch_temp.CANCEL_FLAGS[user_id] = True
+    dropped = transfer_scheduler.cancel(user_id)
+    if dropped:
+        await db.cancel_queued_jobs(user_id)
+    if not dropped and not transfer_scheduler.running(user_id):
+        return await message.reply_text("ℹ️ Nothing to cancel.")
     await message.reply_text("❌ Batch Process Cancelled Successfully.")
 
 @Client.on_message(filters.command(["stats"]))
 async def send_stats(client: Client, message: Message):
     """New command: Shows user stats."""
     user_id = message.from_user.id
-    total_users = await db.total_users_count()
-    premium_users = await db.total_premium_count()
-    banned_users = await db.total_banned_count()
-    usage = await db.get_user_info(user_id)
-    daily_usage = usage.get('daily_usage', 0) if usage else 0
+    # Global numbers come from the cached aggregation snapshot
+    snapshot = await stats_snapshot.get()
+    total_users = snapshot['total_users']
+    premium_users = snapshot['premium_users']
+    banned_users = snapshot['banned_users']
+    ctx = await get_context(message)
+    daily_limit = ctx.daily_limit or "♾️"
+    transfers = progress_bus.transfers(user_id)
     text = f"<b>📊 Bot Statistics</b>\n\n" \
            f"<b>Total Users:</b> {total_users}\n" \
            f"<b>Premium Users:</b> {premium_users}\n" \
            f"<b>Banned Users:</b> {banned_users}\n\n" \
-           f"<b>Your Daily Usage:</b> {daily_usage}/{FREE_LIMIT_DAILY}"
+           f"<b>Your Daily Usage:</b> {ctx.daily_usage}/{daily_limit}"
+    for t in transfers:
+        text += f"\n<b>⚡ {t['status']}:</b> {humanbytes(t['current'])} of {humanbytes(t['total'])} " \
+                f"at {humanbytes(t['speed'])}/s, ETA {TimeFormatter(t['eta'] * 1000)}"
     await message.reply_text(text, parse_mode=enums.ParseMode.HTML)
 
 # ==============================================================================
@@ -410,25 +433,11 @@ async def save(client: Client, message: Message):
         return
     
     user_id = message.from_user.id
-    # --- 1. GLOBAL LIMIT CHECK ---
-    is_limit_reached = await db.check_limit(user_id)
-    if is_limit_reached:
-        btn = InlineKeyboardMarkup([[InlineKeyboardButton("💎 Upgrade to Premium", callback_data="buy_premium")]])
-        return await message.reply_photo(
-            photo=SUBSCRIPTION,
-            caption=script.LIMIT_REACHED,
-            reply_markup=btn,
-            parse_mode=enums.ParseMode.HTML
-        )
+    # --- 1. GLOBAL LIMIT CHECK (Peek; Each File Is Counted Atomically Later) ---
+    if await db.check_limit(user_id):
+        return await send_limit_reached(message)
     
-    # --- 2. CANCEL FLAG CHECK (Fixed Bug: Was inverted) ---
-    if batch_temp.CANCEL_FLAGS.get(user_id, False):
-        return await message.reply_text("<b>⚠️ Previous Task was Cancelled. Start New.</b>", parse_mode=enums.ParseMode.HTML)
-    
-    # Set flag to False (not cancelled)
-    batch_temp.CANCEL_FLAGS[user_id] = False
-    
-    # --- 3. LINK PARSING ---
+    # --- 2. LINK PARSING ---
     datas = message.text.split("/")
     temp = datas[-1].replace("?single", "").split("-")
     fromID = int(temp[0].strip())
@@ -437,96 +446,382 @@ async def save(client: Client, message: Message):
     # Determine Link Type
     is_private_link = "https://t.me/c/" in message.text
     is_batch = "https://t.me/b/" in message.text
-    is_public_link = not is_private_link and not is_batch
     
-    # --- 4. PROCESSING LOOP (Enhanced with Try-Except per File) ---
-    for msgid in range(fromID, toID + 1):
-        if batch_temp.CANCEL_FLAGS.get(user_id):
-            break
-        
-        try:
-            # ==================================================================
-            # 🟢 PATH A: PUBLIC LINK HANDLING (No Login Required)
-            # ==================================================================
-            if is_public_link:
-                username = datas[3]
+    if is_private_link:
+        chatid = int("-100" + datas[4])
+    elif is_batch:
+        chatid = datas[4]
+    else:
+        chatid = datas[3]
+    
+    # --- 3. PERSIST THE BATCH (Resumed After a Restart) ---
+    ctx = await get_context(message)
+    premium = ctx.is_premium
+    settings = {
+        'premium': premium,
+        'caption': ctx.caption,
+        'thumbnail': ctx.thumbnail
+    }
+    job_id = await db.create_job(
+        user_id, message.chat.id, message.id, chatid, fromID, toID, is_private_link or is_batch, settings
+    )
+    
+    # --- 4. HAND OFF TO THE SCHEDULER (Fair Queuing, Premium Lane) ---
+    # The handler returns right away; the batch starts when a slot is free.
+    position = transfer_scheduler.submit(
+        user_id, premium,
+        lambda: run_batch(client, message, chatid, fromID, toID, is_private_link or is_batch, job_id)
+    )
+    if position:
+        await message.reply_text(
+            f"<b>⏳ Queued</b>\n\n<i>Your request is #{position} in line and starts automatically.</i>",
+            parse_mode=enums.ParseMode.HTML
+        )
+
+async def run_batch(client: Client, message: Message, chatid, fromID: int, toID: int, needs_login: bool, job_id=None):
+    """
+    Runs one link's message range through the transfer pipeline (started by the scheduler).
+    Every delivered file moves the job's checkpoint in the `jobs` collection.
+    """
+    user_id = message.from_user.id
+    if job_id:
+        await db.set_job_status(job_id, "running")
+    
+    # Every exit records a final status (early returns count as failed), so
+    # resume_jobs only picks up batches a restart actually interrupted
+    status = "failed"
+    try:
+        # --- PROCESSING PIPELINE (plan → prepare → download → upload) ---
+        # Message N+1 downloads while message N uploads. The user client is
+        # borrowed from the session pool once per batch and returned (still
+        # connected) when the pipeline drains.
+        async with AsyncExitStack() as stack:
+            state = {"acc": None, "stop": False}
+            checkpoint = BatchCheckpoint()
+
+            async def borrow_user_client():
+                if state["acc"] is not None:
+                    return state["acc"]
+                # 1. Check Session
+                user_data = await db.get_session(user_id)
+                if user_data is None:
+                    await message.reply(
+                        "<b>🔒 Authentication Required</b>\n\n"
+                        "<i>Access to this content requires login.</i>\n"
+                        "<i>Use /login to securely authorize your account.</i>",
+                        parse_mode=enums.ParseMode.HTML
+                    )
+                    state["stop"] = True
+                    return None
+            
+                # 2. Borrow a Connected User Client from the Pool
+                try:
+                    state["acc"] = await stack.enter_async_context(session_pool.acquire(user_id, user_data))
+                except Exception as e:
+                    state["stop"] = True
+                    await message.reply(f"<b>❌ Authentication Failed</b>\n\n<i>Your session may have expired. Please /logout and /login again.</i>\n<code>{e}</code>", parse_mode=enums.ParseMode.HTML)
+                    return None
+                return state["acc"]
+
+            async def settle(entry):
+                cursor = checkpoint.settle(entry)
+                if cursor is not None and job_id:
+                    await db.advance_job(job_id, cursor)
+
+            async def prepare_stage(item):
+                if state["stop"] or batch_temp.CANCEL_FLAGS.get(user_id):
+                    return None
+                if isinstance(item, list):
+                    entry = checkpoint.issue([m.id for m in item])
+                else:
+                    entry = checkpoint.issue([getattr(item, "id", item)])
+                try:
+                    job = await prepare_item(item)
+                except QuotaExhausted:
+                    if not state["stop"]:
+                        state["stop"] = True
+                        await send_limit_reached(message)
+                    return None
+                if job is None:
+                    # Delivered in prepare (public copy, file cache, server-side
+                    # copy, text) or not deliverable at all; either way it is done
+                    if not state["stop"] and not batch_temp.CANCEL_FLAGS.get(user_id):
+                        await settle(entry)
+                    return None
+                job.checkpoint_entry = entry
+                return job
+
+            async def prepare_item(item):
+                # ==================================================================
+                # 🔵 PLANNED MESSAGE / ALBUM (Private Links, Already Fetched in Bulk)
+                # ==================================================================
+                if isinstance(item, list):
+                    return await prepare_album(client, state["acc"], message, chatid, item)
+                if isinstance(item, Message):
+                    return await prepare_restricted_content(client, state["acc"], message, chatid, item.id, msg=item)
+            
+                # ==================================================================
+                # 🟢 PATH A: PUBLIC LINK HANDLING (No Login Required)
+                # ==================================================================
+                msgid = item
+                window = await take_quota(user_id)
                 try:
                     await client.copy_message(
                         chat_id=message.chat.id,
-                        from_chat_id=username,
+                        from_chat_id=chatid,
                         message_id=msgid,
                         reply_to_message_id=message.id
                     )
-                    await db.add_traffic(user_id)
+                    usage_ledger.record(user_id)
                     await asyncio.sleep(1)
-                    continue
+                    return None
                 except Exception as e:
                     logger.warning(f"Public copy failed, falling to private: {e}")
-                    # Fallback to private logic
-            
-            # ==================================================================
-            # 🟠 PATH B: PRIVATE / RESTRICTED HANDLING (Login Required)
-            # ==================================================================
-            
-            # 1. Check Session
-            user_data = await db.get_session(user_id)
-            if user_data is None:
-                await message.reply(
-                    "<b>🔒 Authentication Required</b>\n\n"
-                    "<i>Access to this content requires login.</i>\n"
-                    "<i>Use /login to securely authorize your account.</i>",
-                    parse_mode=enums.ParseMode.HTML
-                )
-                batch_temp.CANCEL_FLAGS[user_id] = True
-                return
+                # Nothing was sent; the fallback counts the file again only if it delivers media
+                await db.refund_quota(user_id, window)
             
-            # 2. Connect User Client (Enhanced with Error Handling)
+                # ==================================================================
+                # 🟠 PATH B: RESTRICTED FALLBACK (Login Required)
+                # ==================================================================
+                acc = await borrow_user_client()
+                if acc is None:
+                    return None
+                return await prepare_restricted_content(client, acc, message, chatid, msgid)
+
+            async def report_error(stage, item, e):
+                if isinstance(item, list):
+                    item = item[0]
+                msgid = getattr(item, "msgid", None) or getattr(item, "id", item)
+                await message.reply(f"<b>⚠️ Error on File {msgid}:</b> {e}", parse_mode=enums.ParseMode.HTML)
+
+            if not needs_login:
+                items = range(fromID, toID + 1)
+            else:
+                acc = await borrow_user_client()
+                if acc is None:
+                    return
+                # Fetch the range in chunks; deleted/unsupported ids never enter the pipeline
+                items = group_albums(plan_range(acc, chatid, fromID, toID, get_message_type))
+
+            async def upload_and_checkpoint(job):
+                if await upload_stage(job):
+                    await settle(job.checkpoint_entry)
+
+            pipeline = Pipeline(
+                [
+                    Stage("prepare", prepare_stage, depth=PIPELINE_PREPARE_DEPTH),
+                    Stage("download", download_stage, depth=PIPELINE_DOWNLOAD_DEPTH),
+                    Stage("upload", upload_and_checkpoint, depth=PIPELINE_UPLOAD_DEPTH),
+                ],
+                should_stop=lambda: state["stop"] or batch_temp.CANCEL_FLAGS.get(user_id),
+                on_error=report_error
+            )
+            status = "done"
             try:
-                acc = Client(
-                    "saverestricted",
-                    session_string=user_data,
-                    api_hash=API_HASH,
-                    api_id=API_ID,
-                    in_memory=True,
-                    max_concurrent_transmissions=20  # Increased for power
-                )
-                await acc.connect()
+                await pipeline.run(items)
             except Exception as e:
-                batch_temp.CANCEL_FLAGS[user_id] = True
-                return await message.reply(f"<b>❌ Authentication Failed</b>\n\n<i>Your session may have expired. Please /logout and /login again.</i>\n<code>{e}</code>", parse_mode=enums.ParseMode.HTML)
-            
-            # 3. Route to Handler
-            if is_private_link:
-                chatid = int("-100" + datas[4])
-            elif is_batch:
-                chatid = datas[4]
-            else:
-                chatid = datas[3]
-            
-            await handle_restricted_content(client, acc, message, chatid, msgid)
-            await asyncio.sleep(1)  # Reduced delay for efficiency
+                status = "failed"
+                logger.error(f"Batch {chatid} {fromID}-{toID} error: {e}")
+                await message.reply(f"<b>⚠️ Error fetching messages:</b> {e}", parse_mode=enums.ParseMode.HTML)
+            if batch_temp.CANCEL_FLAGS.get(user_id):
+                status = "cancelled"
+            elif state["stop"]:
+                status = "failed"
+    except asyncio.CancelledError:
+        status = None  # Shutdown: stays "running" and is resumed after the restart
+        raise
+    finally:
+        if job_id and status:
+            await db.set_job_status(job_id, status)
+
+async def resume_jobs(client: Client):
+    """Re-queues batches a previous process left unfinished, from their checkpoint."""
+    resumed = 0
+    async for record in db.get_unfinished_jobs():
+        job_id = record['_id']
+        start = record['cursor'] + 1 if record.get('cursor') else record['from_id']
+        if start > record['to_id']:
+            await db.set_job_status(job_id, "done")
+            continue
+        try:
+            # The original link message carries the user and the reply target
+            message = await client.get_messages(record['chat_id'], record['request_id'])
         except Exception as e:
-            logger.error(f"File {msgid} error: {e}")
-            await message.reply(f"<b>⚠️ Error on File {msgid}:</b> {e}", parse_mode=enums.ParseMode.HTML)
-    
-    batch_temp.CANCEL_FLAGS[user_id] = True  # Reset after completion
+            logger.warning(f"Cannot resume job {job_id}: {e}")
+            message = None
+        if not message or message.empty or not message.from_user:
+            await db.set_job_status(job_id, "failed")
+            continue
+        
+        transfer_scheduler.submit(
+            record['user_id'], record['settings'].get('premium', False),
+            lambda m=message, r=record, s=start: run_batch(client, m, r['source'], s, r['to_id'], r['needs_login'], r['_id'])
+        )
+        resumed += 1
+        try:
+            await message.reply_text(
+                f"<b>♻️ Resuming Your Batch</b>\n\n<i>Continuing from message {start} after a restart.</i>",
+                parse_mode=enums.ParseMode.HTML
+            )
+        except Exception:
+            pass
+    if resumed:
+        logger.info(f"Resumed {resumed} unfinished batch jobs")
 
 # ==============================================================================
-# 📥 RESTRICTED CONTENT DOWNLOADER (Enhanced with Resume & Better Cleanup)
+# 📥 RESTRICTED CONTENT DOWNLOADER (Pipelined: Prepare → Download → Upload)
 # ==============================================================================
-async def handle_restricted_content(client: Client, acc, message: Message, chat_target, msgid):
+class TransferJob(object):
+    """
+    State of one restricted file as it moves through the pipeline stages.
+    """
+    def __init__(self, client: Client, acc, message: Message, msg: Message, msgid: int, msg_type: str, file_size: int):
+        self.client = client
+        self.acc = acc
+        self.message = message
+        self.msg = msg
+        self.msgid = msgid
+        self.msg_type = msg_type
+        self.file_size = file_size
+        self.user_id = message.from_user.id
+        self.spool_entries = []  # Reserved spool directories (see Rexbots/spool.py)
+        self.work_dir = None  # Album members: a directory inside the album's reservation
+        self.smsg = None
+        self.file = None
+        self.ph_path = None
+        self.caption = None
+        self.relayed = False
+        self.thumb_id = None  # User's custom thumbnail file_id (cache variant)
+        self.tracker = None  # Progress numbers (see Rexbots/progress.py)
+        self.cached_file_id = None  # Bot-side file_id from the delivered-file cache (album members)
+        self.words = None  # User's delete/replace rules (see Rexbots/words.py)
+        self.started = time.monotonic()
+        self.quota_window = None  # Set while the file is counted but not yet delivered
+
+    @property
+    def media(self):
+        return getattr(self.msg, self.msg_type.lower(), None)
+
+    @property
+    def source_key(self) -> str:
+        return f"{self.msg.chat.id}:{self.msg.id}"
+
+    @property
+    def file_unique_id(self) -> str:
+        return getattr(self.media, "file_unique_id", None)
+
+    @property
+    def original_file_name(self) -> str:
+        return getattr(self.media, "file_name", None) or os.path.basename(self.file or "file")
+
+    @property
+    def file_name(self) -> str:
+        name = self.original_file_name
+        return (self.words.rewrite(name) or "file") if self.words else name
+
+    @property
+    def renamed(self) -> bool:
+        """True when the user's word rules change the delivered file name."""
+        return bool(getattr(self.media, "file_name", None)) and self.file_name != self.original_file_name
+
+    @property
+    def cache_variant(self):
+        """
+        Delivered-file cache variant: the custom thumbnail plus, for renamed
+        files, the delivered name (it is baked into the cached file_id).
+        """
+        if not self.renamed:
+            return self.thumb_id
+        return f"{self.thumb_id or ''}|name:{md5(self.file_name.encode()).hexdigest()}"
+
+    @property
+    def source_caption(self) -> str:
+        caption = self.msg.caption or ""
+        return self.words.rewrite(caption) if self.words else caption
+
+    @property
+    def temp_dir(self) -> str:
+        return self.work_dir or self.spool_entries[0].path
+
+    async def reserve(self, size: int) -> str:
+        """Reserves spool space, queueing while the disk budget is exhausted."""
+        async def notify_queued():
+            try:
+                await self.smsg.edit("<b>⏳ Queued: waiting for free disk space...</b>", parse_mode=enums.ParseMode.HTML)
+            except Exception:
+                pass
+        entry = await spool.reserve(size, on_wait=notify_queued)
+        self.spool_entries.append(entry)
+        return entry.path
+
+    async def cleanup(self):
+        progress_bus.untrack(self.tracker)
+        self.tracker = None
+        if self.quota_window is not None:
+            # Dropped before delivery (cancel, download or upload failure)
+            window, self.quota_window = self.quota_window, None
+            try:
+                await db.refund_quota(self.user_id, window)
+            except Exception as e:
+                logger.warning(f"Quota refund failed for {self.user_id}: {e}")
+        for entry in self.spool_entries:
+            await entry.release()
+        self.spool_entries = []
+
+class AlbumJob(object):
+    """
+    Members of one media group, delivered together with send_media_group.
+    """
+    def __init__(self, client: Client, message: Message, jobs: list):
+        self.client = client
+        self.message = message
+        self.jobs = jobs
+        self.user_id = message.from_user.id
+        self.smsg = None
+        self.caption = None
+        self.relayed = False
+        self.spool_entries = []  # One reservation covering every downloaded member
+
+    @property
+    def msgid(self) -> int:
+        return self.jobs[0].msgid
+
+    async def reserve(self, size: int) -> str:
+        """Reserves spool space for the whole album at once, queueing while the disk budget is exhausted."""
+        async def notify_queued():
+            try:
+                await self.smsg.edit("<b>⏳ Queued: waiting for free disk space...</b>", parse_mode=enums.ParseMode.HTML)
+            except Exception:
+                pass
+        entry = await spool.reserve(size, on_wait=notify_queued)
+        self.spool_entries.append(entry)
+        return entry.path
+
+    async def cleanup(self):
+        for job in self.jobs:
+            await job.cleanup()
+        for entry in self.spool_entries:
+            await entry.release()
+        self.spool_entries = []
+
+async def prepare_restricted_content(client: Client, acc, message: Message, chat_target, msgid, msg: Message = None, album: bool = False):
+    """
+    Applies limits to the source message (fetching it unless already planned). Returns a TransferJob for media.
+    Album members are never sent on their own: a cache hit is only recorded on the job.
+    """
     user_id = message.from_user.id
-    try:
-        msg: Message = await acc.get_messages(chat_target, msgid)
-    except Exception as e:
-        logger.error(f"Error fetching message {msgid}: {e}")
-        return
+    if msg is None:
+        try:
+            msg = await acc.get_messages(chat_target, msgid)
+        except Exception as e:
+            logger.error(f"Error fetching message {msgid}: {e}")
+            return None
     if msg.empty:
-        return
+        return None
     
     msg_type = get_message_type(msg)
     if not msg_type:
-        return
+        return None
     
     # --- SIZE LIMIT CHECK ---
     file_size = 0
@@ -534,7 +829,8 @@ async def handle_restricted_content(client: Client, acc, message: Message, chat_
     elif msg_type == "Video": file_size = msg.video.file_size
     elif msg_type == "Audio": file_size = msg.audio.file_size
     
-    if file_size > FREE_LIMIT_SIZE and not await db.is_premium(user_id):
+    ctx = await get_context(message)
+    if file_size > FREE_LIMIT_SIZE and not ctx.is_premium:
         btn = InlineKeyboardMarkup([[InlineKeyboardButton("💎 Upgrade to Premium", callback_data="buy_premium")]])
         await client.send_message(
             message.chat.id,
@@ -542,106 +838,411 @@ async def handle_restricted_content(client: Client, acc, message: Message, chat_
             reply_markup=btn,
             parse_mode=enums.ParseMode.HTML
         )
-        return
+        return None
+    
+    words = await word_cache.get(user_id)
     
     # --- TEXT HANDLING ---
     if msg_type == "Text":
+        text, entities = msg.text, msg.entities
+        if words:
+            text, entities = words.rewrite_with_entities(text, entities)
         try:
-            await client.send_message(message.chat.id, msg.text, entities=msg.entities, parse_mode=enums.ParseMode.HTML)
-            return
+            await client.send_message(message.chat.id, text, entities=entities, parse_mode=enums.ParseMode.HTML)
         except Exception as e:
             logger.error(f"Text send error: {e}")
-            return
+        await asyncio.sleep(1)
+        return None
+    
+    # --- COUNT THE FILE (Check + Increment in One Atomic Call) ---
+    window = await take_quota(user_id)
+    job = TransferJob(client, acc, message, msg, msgid, msg_type, file_size)
+    job.quota_window = window
+    job.thumb_id = ctx.thumbnail
+    job.words = words
+    
+    # --- DELIVERED FILE CACHE (No Transfer at All) ---
+    if album:
+        entry = await lookup_cache(job)
+        job.cached_file_id = entry['file_id'] if entry else None
+        return job
+    if await send_from_cache(job):
+        record_usage(job)
+        await asyncio.sleep(1)
+        return None
     
-    # --- INCREMENT COUNTER ---
-    await db.add_traffic(user_id)
+    # --- SERVER-SIDE COPY (Unprotected Sources Need No Transfer) ---
+    if await copy_unprotected(job):
+        record_usage(job)
+        await asyncio.sleep(1)
+        return None
+    return job
+
+def is_protected(msg: Message) -> bool:
+    """True when the source forbids forwarding/copying (restricted content)."""
+    return bool(msg.has_protected_content or getattr(msg.chat, "has_protected_content", False))
+
+async def copy_unprotected(job: TransferJob) -> bool:
+    """
+    Copies an unprotected source message server-side through the user session
+    into the user's chat with the bot. Custom thumbnails and renamed files
+    need a re-upload, so those jobs keep the transfer path.
+    """
+    if is_protected(job.msg) or job.thumb_id or job.renamed:
+        return False
+    try:
+        await job.acc.copy_message(
+            chat_id=job.client.me.username,
+            from_chat_id=job.msg.chat.id,
+            message_id=job.msg.id,
+            caption=await render_caption(job)
+        )
+        return True
+    except Exception as e:
+        logger.warning(f"Server-side copy failed for {job.source_key}, transferring: {e}")
+        return False
+
+async def lookup_cache(job: TransferJob):
+    """Finds a previously delivered copy of the job's file, if any."""
+    if not job.file_unique_id:
+        return None
+    return await db.get_cached_file(job.source_key, job.file_unique_id, job.cache_variant)
+
+async def send_from_cache(job: TransferJob) -> bool:
+    """Re-sends a previously delivered copy of the file by its bot-side file_id."""
+    entry = await lookup_cache(job)
+    if not entry:
+        return False
+    try:
+        caption = await render_caption(job)
+        await job.client.send_cached_media(job.message.chat.id, entry['file_id'], caption=caption)
+        return True
+    except Exception as e:
+        # The file reference went stale; evict it and transfer normally
+        logger.warning(f"Cached send failed for {job.source_key}: {e}")
+        await db.drop_cached_file(job.file_unique_id, job.cache_variant)
+        return False
+
+def record_usage(job: TransferJob):
+    """Counts a delivered file in the write-behind usage ledger."""
+    job.quota_window = None  # Delivered: the quota is spent
+    size = job.file_size or getattr(job.media, "file_size", 0)  # Photos carry no announced size
+    usage_ledger.record(job.user_id, size, time.monotonic() - job.started)
+
+async def remember_delivery(job: TransferJob, sent: Message):
+    """Stores the bot-side file_id of a delivered file for later requests."""
+    media = getattr(sent, job.msg_type.lower(), None) if sent else None
+    if not media or not job.file_unique_id:
+        return
+    try:
+        await db.cache_file(job.source_key, job.file_unique_id, job.cache_variant, media.file_id, job.msg_type)
+    except Exception as e:
+        logger.error(f"File cache write error: {e}")
+
+async def handle_restricted_content(client: Client, acc, message: Message, chat_target, msgid):
+    """Processes a single message without pipelining (prepare, download, upload)."""
+    job = await prepare_restricted_content(client, acc, message, chat_target, msgid)
+    if job:
+        job = await download_stage(job)
+    if job:
+        await upload_stage(job)
+
+async def prepare_album(client: Client, acc, message: Message, chat_target, msgs: list):
+    """Prepares every member of a media group. Returns an AlbumJob, or a plain job if one member is left."""
+    jobs = []
+    try:
+        for msg in msgs:
+            job = await prepare_restricted_content(client, acc, message, chat_target, msg.id, msg=msg, album=True)
+            if job:
+                jobs.append(job)
+    except QuotaExhausted:
+        # The album is not sent partially; give back the members counted so far
+        for job in jobs:
+            await job.cleanup()
+        raise
+    if len(jobs) < 2:
+        return jobs[0] if jobs else None
+    return AlbumJob(client, message, jobs)
+
+async def fetch_thumbnail(job: TransferJob):
+    """Resolves the thumbnail path: user's custom thumbnail first, original as fallback."""
+    # 1. Custom Thumbnail (Priority, Cached per User)
+    if job.thumb_id:
+        try:
+            return await thumb_cache.get(job.client, job.user_id, job.thumb_id)
+        except Exception as e:
+            logger.error(f"Custom thumb download error: {e}")
+    
+    # 2. Original Thumbnail (Fallback)
+    try:
+        if job.msg_type in ["Video", "Document"] and getattr(job.media, 'thumbs', None):
+            return await job.acc.download_media(job.media.thumbs[0].file_id, file_name=f"{job.temp_dir}/thumb.jpg")
+    except:
+        pass
+    return None
+
+async def render_caption(job: TransferJob):
+    """Builds the final caption from the user's compiled template or the default one."""
+    date_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    compiled = await caption_cache.get(job.user_id)
+    if compiled:
+        chat = job.msg.chat
+        return render_compiled(compiled, {
+            'file_name': job.file_name,
+            'file_size': humanbytes(job.file_size),
+            'date': date_str,
+            'caption': job.source_caption,
+            'msg_id': job.msg.id,
+            'chat_name': getattr(chat, "title", None) or getattr(chat, "username", None) or ""
+        })
+    final_caption = script.CAPTION.format(
+        file_name=job.file_name,
+        file_size=humanbytes(job.file_size),
+        date=date_str
+    )
+    if job.source_caption:
+        final_caption += f"\n\n{job.source_caption}"
+    return final_caption
+
+async def relay_to_user(job: TransferJob, thumb_task, caption_task):
+    """Streams the media from the user session into the bot upload (no disk)."""
+    message = job.message
+    job.tracker.reset("Relaying", job.file_size)
+    sent = await relay_media(
+        job.client, job.acc, message.chat.id, job.msg, job.msg_type, job.file_size, job.file_name,
+        meta=lambda: asyncio.gather(thumb_task, caption_task),
+        progress=lambda current, total: progress(current, total, job.tracker),
+        is_cancelled=lambda: batch_temp.CANCEL_FLAGS.get(job.user_id)
+    )
+    record_usage(job)
+    await remember_delivery(job, sent)
+
+async def download_to_disk(job: TransferJob, file_path: str, on_progress):
+    """
+    Downloads the job's media with retries. Sized media uses the ranged
+    downloader, which resumes from the last written chunk; anything else
+    (photos) is re-fetched whole. Every retry renews the file reference.
+    """
+    if job.file_size:
+        return await download_ranged(
+            job.acc, job.msg, job.file_size, file_path,
+            progress=on_progress,
+            is_cancelled=lambda: batch_temp.CANCEL_FLAGS.get(job.user_id)
+        )
+    for attempt in range(1, transfer_retry.attempts + 1):
+        # download_media logs and swallows most errors, returning None
+        path = await job.acc.download_media(job.msg, file_name=file_path, progress=on_progress)
+        if path:
+            return path
+        if batch_temp.CANCEL_FLAGS.get(job.user_id):
+            raise Exception("Cancelled")
+        if attempt < transfer_retry.attempts:
+            logger.warning(f"Download of {job.source_key} failed, retry {attempt}/{transfer_retry.attempts - 1}")
+            await transfer_retry.backoff(attempt)
+            job.msg = await refresh_message(job.acc, job.msg)
+    raise ValueError(f"Download of message {job.msgid} failed")
+
+async def download_stage(job: TransferJob):
+    """Downloads the media while the thumbnail and caption are prepared alongside."""
+    message = job.message
+    if batch_temp.CANCEL_FLAGS.get(job.user_id):
+        await job.cleanup()
+        return None
+    if isinstance(job, AlbumJob):
+        return await download_album(job)
     
     # --- DOWNLOAD PROCESS (Enhanced with Resume Check) ---
-    smsg = await client.send_message(message.chat.id, '<b>⬇️ Starting Download...</b>', reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
+    job.smsg = await job.client.send_message(message.chat.id, '<b>⬇️ Starting Download...</b>', reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
+    job.tracker = progress_bus.track(job.client, job.smsg, job.user_id)
+    await job.reserve(0)  # Small entry for thumbnails
     
-    temp_dir = f"downloads/{message.id}_{msgid}"  # Unique per file
-    if not os.path.exists(temp_dir): os.makedirs(temp_dir)
+    # Thumbnail fetch and caption rendering overlap with the main transfer
+    thumb_task = asyncio.create_task(fetch_thumbnail(job))
+    caption_task = asyncio.create_task(render_caption(job))
     
-    file_path = f"{temp_dir}/file"  # Placeholder path
+    # --- STREAMING RELAY (Zero-Disk; the disk path below is the fallback) ---
+    if RELAY_MODE and job.msg_type in ("Document", "Video", "Audio"):
+        try:
+            await relay_to_user(job, thumb_task, caption_task)
+            job.relayed = True
+            return job
+        except Exception as e:
+            if batch_temp.CANCEL_FLAGS.get(job.user_id) or "Cancelled" in str(e):
+                thumb_task.cancel()
+                caption_task.cancel()
+                await job.cleanup()
+                await job.smsg.edit("❌ **Task Cancelled**")
+                return None
+            logger.warning(f"Relay failed for {job.msgid}, spooling to disk: {e}")
     
+    # --- DISK SPOOL ADMISSION (Queue Until the Announced Size Fits) ---
     try:
-        asyncio.create_task(downstatus(client, f'{message.id}downstatus.txt', smsg, message.chat.id))
-        
-        # Download with progress (Supports resume if partial file exists - Pyrogram handles internally)
-        file = await acc.download_media(
-            msg,
-            file_name=file_path,
-            progress=progress,
-            progress_args=[message, "down", "Downloading"]
+        file_path = f"{await job.reserve(getattr(job.media, 'file_size', 0) or 0)}/file"
+    except SpoolFull as e:
+        thumb_task.cancel()
+        caption_task.cancel()
+        await job.cleanup()
+        await job.smsg.edit(f"<b>❌ Not Enough Disk Space</b>\n\n<i>{e}</i>", parse_mode=enums.ParseMode.HTML)
+        return None
+    
+    try:
+        # Download with progress (Retries resume from the last written chunk)
+        job.tracker.reset("Downloading", job.file_size)
+        job.file = await download_to_disk(
+            job, file_path, lambda current, total: progress(current, total, job.tracker)
         )
         
-        if os.path.exists(f'{message.id}downstatus.txt'): os.remove(f'{message.id}downstatus.txt')
+        job.ph_path, job.caption = await asyncio.gather(thumb_task, caption_task)
     except Exception as e:
-        if batch_temp.CANCEL_FLAGS.get(user_id) or "Cancelled" in str(e):
-            if os.path.exists(temp_dir): shutil.rmtree(temp_dir)
-            return await smsg.edit("❌ **Task Cancelled**")
+        thumb_task.cancel()
+        caption_task.cancel()
+        await job.cleanup()
+        if batch_temp.CANCEL_FLAGS.get(job.user_id) or "Cancelled" in str(e):
+            await job.smsg.edit("❌ **Task Cancelled**")
+            return None
         logger.error(f"Download error: {e}")
-        return await smsg.delete()
-    
-    # --- UPLOAD PROCESS ---
+        await job.smsg.delete()
+        return None
+    return job
+
+async def upload_stage(job: TransferJob) -> bool:
+    """Uploads a downloaded file to the user and removes its temp files. Returns True if it was delivered."""
+    client, message = job.client, job.message
+    delivered = cancelled = False
+    error = None
     try:
-        asyncio.create_task(upstatus(client, f'{message.id}upstatus.txt', smsg, message.chat.id))
-        
-        # 1. Custom Thumbnail (Priority)
-        ph_path = None
-        thumb_id = await db.get_thumbnail(user_id)
-        
-        if thumb_id:
-            try:
-                ph_path = await client.download_media(thumb_id, file_name=f"{temp_dir}/custom_thumb.jpg")
-            except Exception as e:
-                logger.error(f"Custom thumb download error: {e}")
-        
-        # 2. Original Thumbnail (Fallback)
-        if not ph_path:
-            try:
-                if msg_type in ["Video", "Document"] and hasattr(msg, 'thumbs') and msg.thumbs:
-                    ph_path = await acc.download_media(msg.thumbs[0].file_id, file_name=f"{temp_dir}/thumb.jpg")
-            except:
-                pass
-        
-        # Custom Caption (Improved with more variables)
-        custom_caption = await db.get_caption(user_id)
-        date_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-        if custom_caption:
-            final_caption = custom_caption.format(
-                file_name=os.path.basename(file),
-                file_size=humanbytes(file_size),
-                date=date_str
-            )
+        if job.relayed:
+            delivered = True  # Already delivered by the streaming relay
+        elif batch_temp.CANCEL_FLAGS.get(job.user_id):
+            cancelled = True
+        elif isinstance(job, AlbumJob):
+            await upload_album(job)
+            delivered = True
         else:
-            final_caption = script.CAPTION.format(
-                file_name=os.path.basename(file),
-                file_size=humanbytes(file_size),
-                date=date_str
-            )
-            if msg.caption:
-                final_caption += f"\n\n{msg.caption}"
-        
-        # Send File (Enhanced with Error Handling)
-        if msg_type == "Document":
-            await client.send_document(message.chat.id, file, thumb=ph_path, caption=final_caption, progress=progress, progress_args=[message, "up", "Uploading"])
-        elif msg_type == "Video":
-            await client.send_video(message.chat.id, file, duration=msg.video.duration, width=msg.video.width, height=msg.video.height, thumb=ph_path, caption=final_caption, progress=progress, progress_args=[message, "up", "Uploading"])
-        elif msg_type == "Audio":
-            await client.send_audio(message.chat.id, file, thumb=ph_path, caption=final_caption, progress=progress, progress_args=[message, "up", "Uploading"])
-        elif msg_type == "Photo":
-            await client.send_photo(message.chat.id, file, caption=final_caption)
-        
+            await upload_file(job)
+            delivered = True
     except Exception as e:
         logger.error(f"Upload error: {e}")
-        await smsg.edit(f"Upload Failed: {e}")
+        error = e
+    finally:
+        # Spool space is released on every exit, even if a status edit below fails
+        await job.cleanup()
     
-    # Final Cleanup (Enhanced)
-    if os.path.exists(f'{message.id}upstatus.txt'): os.remove(f'{message.id}upstatus.txt')
-    if os.path.exists(temp_dir):
-        shutil.rmtree(temp_dir, ignore_errors=True)
-    await client.delete_messages(message.chat.id, [smsg.id])
+    # Final Status (Best Effort)
+    try:
+        if cancelled:
+            await job.smsg.edit("❌ **Task Cancelled**")
+            return False
+        if error:
+            await job.smsg.edit(f"Upload Failed: {error}")
+        await client.delete_messages(message.chat.id, [job.smsg.id])
+    except Exception as e:
+        logger.warning(f"Status message update failed: {e}")
+    await asyncio.sleep(1)  # Pace outgoing uploads
+    return delivered
+
+async def upload_file(job: TransferJob):
+    """Sends the downloaded file from disk through the concurrent part uploader."""
+    client, message = job.client, job.message
+    # Send File (Enhanced with Error Handling)
+    job.tracker.reset("Uploading", job.file_size)
+    sent = None
+    if job.msg_type in ("Document", "Video", "Audio"):
+        # Parts go up concurrently; a failed part is retried on its own, and a
+        # failed upload resumes with the parts Telegram already has
+        checkpoint = {}
+        for attempt in range(1, transfer_retry.attempts + 1):
+            try:
+                input_file = await upload_stream(
+                    client, iter_file_parts(job.file), os.path.getsize(job.file), job.file_name,
+                    progress=lambda current, total: progress(current, total, job.tracker),
+                    checkpoint=checkpoint
+                )
+                break
+            except Exception as e:
+                if is_cancel(e) or attempt == transfer_retry.attempts:
+                    raise
+                logger.warning(f"Upload of {job.source_key} failed ({e}), resuming at part {len(checkpoint.get('done', ()))}")
+                await transfer_retry.backoff(attempt, e)
+        sent = await send_uploaded_media(
+            client, message.chat.id, input_file, job.msg_type, job.media, job.file_name, job.ph_path, job.caption
+        )
+    elif job.msg_type == "Photo":
+        sent = await client.send_photo(message.chat.id, job.file, caption=job.caption)
+    record_usage(job)
+    await remember_delivery(job, sent)
+
+def cancel_check(current, total, user_id):
+    """Progress callback that only aborts the transfer on /cancel."""
+    if batch_temp.CANCEL_FLAGS.get(user_id):
+        raise Exception("Cancelled")
+
+async def download_member(job: TransferJob):
+    """Downloads one (uncached) album member and its thumbnail into its work_dir."""
+    # Album items are sent from their path, so the path carries the (rewritten) name
+    job.file = await download_to_disk(
+        job, os.path.join(job.temp_dir, os.path.basename(job.file_name)), lambda current, total: cancel_check(current, total, job.user_id)
+    )
+    if job.msg_type in ("Video", "Document"):
+        job.ph_path = await fetch_thumbnail(job)
+
+async def download_album(album: AlbumJob):
+    """Downloads all members of an album concurrently."""
+    album.smsg = await album.client.send_message(
+        album.message.chat.id, f'<b>⬇️ Downloading Album ({len(album.jobs)} files)...</b>',
+        reply_to_message_id=album.message.id, parse_mode=enums.ParseMode.HTML
+    )
+    # The source caption usually sits on one member; it goes on the first item
+    captioned = next((job for job in album.jobs if job.msg.caption), album.jobs[0])
+    # Cached members are sent by file_id; the rest share one reservation sized for all of them,
+    # so concurrent albums never hold part of the spool while waiting for the remainder
+    pending = [job for job in album.jobs if not job.cached_file_id]
+    if pending:
+        try:
+            path = await album.reserve(sum(getattr(job.media, 'file_size', 0) or 0 for job in pending))
+        except SpoolFull as e:
+            await album.cleanup()
+            await album.smsg.edit(f"<b>❌ Not Enough Disk Space</b>\n\n<i>{e}</i>", parse_mode=enums.ParseMode.HTML)
+            return None
+        for i, job in enumerate(pending):
+            job.work_dir = os.path.join(path, str(i))
+            os.makedirs(job.work_dir, exist_ok=True)
+    try:
+        results = await asyncio.gather(
+            render_caption(captioned), *(download_member(job) for job in pending)
+        )
+        album.caption = results[0]
+    except Exception as e:
+        await album.cleanup()
+        if batch_temp.CANCEL_FLAGS.get(album.user_id):
+            await album.smsg.edit("❌ **Task Cancelled**")
+            return None
+        logger.error(f"Album download error: {e}")
+        await album.smsg.delete()
+        return None
+    return album
+
+def album_input_media(job: TransferJob, caption):
+    """InputMedia for one album member, by cached file_id or downloaded path."""
+    media = job.cached_file_id or job.file
+    if job.msg_type == "Photo":
+        return InputMediaPhoto(media, caption=caption)
+    if job.msg_type == "Video":
+        video = job.msg.video
+        return InputMediaVideo(media, thumb=job.ph_path, caption=caption, duration=video.duration, width=video.width, height=video.height, supports_streaming=True)
+    if job.msg_type == "Audio":
+        return InputMediaAudio(media, thumb=job.ph_path, caption=caption)
+    return InputMediaDocument(media, thumb=job.ph_path, caption=caption)
+
+async def upload_album(album: AlbumJob):
+    """Delivers an album with one send_media_group call, caption on the first item."""
+    await album.smsg.edit(f'<b>⬆️ Uploading Album ({len(album.jobs)} files)...</b>', parse_mode=enums.ParseMode.HTML)
+    media = [album_input_media(job, album.caption if i == 0 else None) for i, job in enumerate(album.jobs)]
+    sent = await album.client.send_media_group(album.message.chat.id, media)
+    for job, sent_msg in zip(album.jobs, sent):
+        record_usage(job)
+        if not job.cached_file_id:
+            await remember_delivery(job, sent_msg)
 
 # ==============================================================================
 # 🖱️ CALLBACK QUERY HANDLER (Upgraded with More Interconnections & Dev Prompt)
@@ -744,10 +1345,8 @@ async def button_callbacks(client: Client, callback_query: CallbackQuery):
     elif data in ["cmd_list_btn", "user_stats_btn", "dump_chat_btn", "thumb_btn", "caption_btn", "privacy_btn"]:
         # Example for user_stats_btn
         if data == "user_stats_btn":
-            user_id = callback_query.from_user.id
-            usage = await db.get_user_info(user_id)
-            daily_usage = usage.get('daily_usage', 0) if usage else 0
-            text = f"<b>📊 Your Stats</b>\n\n<b>Daily Usage:</b> {daily_usage}/{FREE_LIMIT_DAILY}\n<b>Premium:</b> {'Yes' if await db.is_premium(user_id) else 'No'}"
+            ctx = await get_context(callback_query)
+            text = f"<b>📊 Your Stats</b>\n\n<b>Daily Usage:</b> {ctx.daily_usage}/{ctx.daily_limit or '♾️'}\n<b>Premium:</b> {'Yes' if ctx.is_premium else 'No'}"
             buttons = [[InlineKeyboardButton("⬅️ Back to Settings", callback_data="settings_btn")]]
             await callback_query.edit_message_caption(
                 caption=text,
@@ -0,0 +1,68 @@
+# Rexbots
+# Don't Remove Credit
+# Telegram Channel @RexBots_Official
+
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+from config import STATS_REFRESH_INTERVAL
+from database.db import db
+from logger import LOGGER
+
+logger = LOGGER(__name__)
+
+# ==============================================================================
+# 📊 GLOBAL STATS SNAPSHOT
+# The global user numbers come from one server-side aggregation
+# (Database.aggregate_user_stats) and are kept here, refreshed in the
+# background every STATS_REFRESH_INTERVAL seconds. The admin and user /stats
+# commands read the snapshot instead of scanning the users collection per
+# command; /users exports live data (Database.export_users).
+# ==============================================================================
+class StatsSnapshot:
+    """
+    Latest global stats and when they were computed.
+    """
+    def __init__(self, interval: int):
+        self.interval = max(interval, 1)
+        self.data: Optional[Dict[str, Any]] = None
+        self.updated = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._refresher: Optional[asyncio.Task] = None
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.updated if self.data else 0.0
+
+    async def get(self) -> Dict[str, Any]:
+        """
+        Returns the snapshot, computing it on first use and starting the
+        background refresher.
+        """
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_loop())
+        if self.data is None:
+            await self.refresh()
+        return self.data
+
+    async def refresh(self) -> Dict[str, Any]:
+        # Created lazily so the snapshot can be built at import time
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.data is None or self.age >= self.interval / 2:
+                self.data = await db.aggregate_user_stats()
+                self.updated = time.monotonic()
+        return self.data
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Stats snapshot refresh failed: {e}")
+
+
+stats_snapshot = StatsSnapshot(STATS_REFRESH_INTERVAL)
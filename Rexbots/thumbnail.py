@@ -1,6 +1,109 @@
+import asyncio
+import os
+import shutil
+from hashlib import md5
+from typing import Dict, Optional, Tuple
+
 from pyrogram import Client, filters, enums
 from pyrogram.types import Message
 from database.db import db
+from Rexbots.context import get_context
+from config import THUMB_CACHE_DIR
+from logger import LOGGER
+
+try:
+    from PIL import Image
+except ImportError:  # Optional: thumbnails are used as downloaded
+    Image = None
+
+logger = LOGGER(__name__)
+
+# Telegram thumbnail constraints
+THUMB_MAX_SIDE = 320
+THUMB_MAX_BYTES = 200 * 1024
+
+# ======================================================
+# Thumbnail Cache
+# One normalized JPEG per user, keyed by the thumbnail's file_id, so a batch
+# downloads the user's /set_thumb photo once instead of once per file.
+# ======================================================
+def normalize_thumbnail(src: str, dst: str) -> None:
+    """
+    Converts an image to a JPEG within Telegram's thumbnail limits
+    (<= 320px per side, <= 200 KB). Without Pillow the file is kept as is.
+    """
+    if Image is None:
+        shutil.move(src, dst)
+        return
+    with Image.open(src) as img:
+        img = img.convert("RGB")
+        img.thumbnail((THUMB_MAX_SIDE, THUMB_MAX_SIDE))
+        for quality in (90, 80, 70, 60, 50, 40):
+            img.save(dst, "JPEG", quality=quality, optimize=True)
+            if os.path.getsize(dst) <= THUMB_MAX_BYTES:
+                break
+    os.remove(src)
+
+
+class ThumbnailCache:
+    """
+    Normalized custom thumbnails on disk, invalidated when a user sets or
+    deletes their thumbnail.
+    """
+    def __init__(self, root: str):
+        self.root = root
+        self._entries: Dict[int, Tuple[str, str]] = {}  # user_id -> (file_id, path)
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    def _path(self, user_id: int, file_id: str) -> str:
+        return os.path.join(self.root, f"{user_id}_{md5(file_id.encode()).hexdigest()}.jpg")
+
+    async def get(self, client: Client, user_id: int, file_id: str) -> Optional[str]:
+        """
+        Returns the local path of the user's normalized thumbnail, downloading
+        it only on the first use of this file_id.
+        """
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            path = self._path(user_id, file_id)
+            entry = self._entries.get(user_id)
+            if entry and entry[0] == file_id and os.path.exists(path):
+                return path
+            if os.path.exists(path):  # Survived a restart
+                self._entries[user_id] = (file_id, path)
+                return path
+
+            await asyncio.to_thread(self._remove_files, user_id)
+            os.makedirs(self.root, exist_ok=True)
+            raw_path = await client.download_media(file_id, file_name=f"{path}.raw")
+            if not raw_path:
+                return None
+            await asyncio.to_thread(normalize_thumbnail, raw_path, path)
+            self._entries[user_id] = (file_id, path)
+            return path
+
+    async def invalidate(self, user_id: int) -> None:
+        """
+        Forgets and deletes a user's cached thumbnail.
+        """
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            self._entries.pop(user_id, None)
+            await asyncio.to_thread(self._remove_files, user_id)
+
+    def _remove_files(self, user_id: int) -> None:
+        if not os.path.isdir(self.root):
+            return
+        prefix = f"{user_id}_"
+        for name in os.listdir(self.root):
+            if name.startswith(prefix):
+                try:
+                    os.remove(os.path.join(self.root, name))
+                except OSError as e:
+                    logger.warning(f"Could not remove cached thumbnail {name}: {e}")
+
+
+thumb_cache = ThumbnailCache(THUMB_CACHE_DIR)
 
 # ======================================================
 # /set_thumb - Set Custom Thumbnail (Reply to Photo)
@@ -8,12 +111,8 @@ from database.db import db
 @Client.on_message(filters.command("set_thumb") & filters.private)
 async def set_custom_thumbnail(client: Client, message: Message):
     user_id = message.from_user.id
-    
-    # 1. Ensure User Exists
-    if not await db.is_user_exist(user_id):
-        await db.add_user(user_id, message.from_user.first_name)
 
-    # 2. Validate Reply
+    # 1. Validate Reply
     if not message.reply_to_message or not message.reply_to_message.photo:
         return await message.reply_text(
             "<b>🖼 Set Custom Thumbnail</b>\n\n"
@@ -22,10 +121,11 @@ async def set_custom_thumbnail(client: Client, message: Message):
             parse_mode=enums.ParseMode.HTML
         )
 
-    # 3. Save File ID to Database (NOT Path)
+    # 2. Save File ID to Database (NOT Path)
     # This ensures it works even if the bot restarts
     file_id = message.reply_to_message.photo.file_id
     await db.set_thumbnail(user_id, file_id)
+    await thumb_cache.invalidate(user_id)
 
     await message.reply_photo(
         photo=file_id,
@@ -42,12 +142,7 @@ async def set_custom_thumbnail(client: Client, message: Message):
 # ======================================================
 @Client.on_message(filters.command(["view_thumb", "see_thumb"]) & filters.private)
 async def view_custom_thumbnail(client: Client, message: Message):
-    user_id = message.from_user.id
-    
-    if not await db.is_user_exist(user_id):
-        await db.add_user(user_id, message.from_user.first_name)
-
-    thumb_id = await db.get_thumbnail(user_id)
+    thumb_id = (await get_context(message)).thumbnail
 
     if thumb_id:
         try:
@@ -76,11 +171,8 @@ async def view_custom_thumbnail(client: Client, message: Message):
 @Client.on_message(filters.command(["del_thumb", "delete_thumb"]) & filters.private)
 async def delete_custom_thumbnail(client: Client, message: Message):
     user_id = message.from_user.id
-    
-    if not await db.is_user_exist(user_id):
-        await db.add_user(user_id, message.from_user.first_name)
 
-    thumb_id = await db.get_thumbnail(user_id)
+    thumb_id = (await get_context(message)).thumbnail
 
     if not thumb_id:
         return await message.reply_text(
@@ -90,6 +182,7 @@ async def delete_custom_thumbnail(client: Client, message: Message):
 
     # Remove from DB
     await db.del_thumbnail(user_id)
+    await thumb_cache.invalidate(user_id)
 
     await message.reply_text(
         "<b>🗑 Custom Thumbnail Deleted</b>\n\n"
@@ -102,11 +195,7 @@ async def delete_custom_thumbnail(client: Client, message: Message):
 # ======================================================
 @Client.on_message(filters.command("thumb_mode") & filters.private)
 async def thumbnail_status(client: Client, message: Message):
-    user_id = message.from_user.id
-    if not await db.is_user_exist(user_id):
-        await db.add_user(user_id, message.from_user.first_name)
-
-    thumb_id = await db.get_thumbnail(user_id)
+    thumb_id = (await get_context(message)).thumbnail
 
     if thumb_id:
         status = "<b>🟢 Custom Thumbnail Active</b>"
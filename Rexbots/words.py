@@ -2,9 +2,119 @@
 # Don't Remove Credit
 # Telegram Channel @RexBots_Official
 
+import copy
+import re
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+
 from pyrogram import Client, filters
-from pyrogram.types import Message
-from database.db import db
+from pyrogram.types import Message, MessageEntity
+from config import USER_CACHE_SIZE, USER_CACHE_TTL
+from database.db import db, UserCache
+
+# ======================================================
+# Word Rewriting Engine
+# A user's delete list and replacement map compile into one alternation
+# regex (longest rule first), so a caption or file name is rewritten in a
+# single pass however many rules there are.
+# ======================================================
+def utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+class WordRewriter:
+    """
+    Compiled delete/replace rules of one user. Replacements win over
+    deletions of the same word.
+    """
+    def __init__(self, delete_words: List[str], replace_words: Dict[str, str]):
+        self.mapping = {word: "" for word in delete_words if word}
+        self.mapping.update({k: v for k, v in replace_words.items() if k})
+        keys = sorted(self.mapping, key=len, reverse=True)
+        self.pattern = re.compile("|".join(map(re.escape, keys)))
+
+    def rewrite(self, text: Optional[str]) -> Optional[str]:
+        if not text:
+            return text
+        return self.pattern.sub(lambda m: self.mapping[m.group(0)], text)
+
+    def rewrite_with_entities(
+        self, text: Optional[str], entities: Optional[List[MessageEntity]]
+    ) -> Tuple[Optional[str], Optional[List[MessageEntity]]]:
+        """
+        Rewrites text and shifts entity offsets (UTF-16 units, as Telegram
+        counts them) to match. Entities emptied by a deletion are dropped.
+        """
+        if not text:
+            return text, entities
+        out = []
+        edits = []    # (original start, original end, new start) in UTF-16 units
+        pos = 0       # Index in text
+        pos16 = 0     # UTF-16 offset in the original text
+        new16 = 0     # UTF-16 offset in the rewritten text
+        for match in self.pattern.finditer(text):
+            gap = text[pos:match.start()]
+            gap16 = utf16_len(gap)
+            pos16 += gap16
+            new16 += gap16
+            replacement = self.mapping[match.group(0)]
+            match16 = utf16_len(match.group(0))
+            out.append(gap)
+            out.append(replacement)
+            edits.append((pos16, pos16 + match16, new16, utf16_len(replacement)))
+            pos16 += match16
+            new16 += edits[-1][3]
+            pos = match.end()
+        if not edits:
+            return text, entities
+        out.append(text[pos:])
+        if not entities:
+            return "".join(out), entities
+
+        ends = [edit[1] for edit in edits]
+
+        def shift(offset: int) -> int:
+            i = bisect_right(ends, offset)  # Edits that end at or before offset
+            if i < len(edits) and edits[i][0] < offset:
+                start, _, new_start, new_len = edits[i]
+                return new_start + min(offset - start, new_len)  # Inside a rewritten word
+            if i == 0:
+                return offset
+            _, end, new_start, new_len = edits[i - 1]
+            return new_start + new_len + (offset - end)
+
+        shifted = []
+        for entity in entities:
+            start = shift(entity.offset)
+            end = shift(entity.offset + entity.length)
+            if end > start:
+                entity = copy.copy(entity)
+                entity.offset, entity.length = start, end - start
+                shifted.append(entity)
+        return "".join(out), shifted
+
+
+class WordCache:
+    """
+    Compiled rules per user, invalidated whenever the user edits them.
+    Bounded like the user cache, so idle users age out.
+    """
+    def __init__(self, max_size: int, ttl: float):
+        self._rules = UserCache(max_size, ttl)
+
+    async def get(self, user_id: int) -> Optional[WordRewriter]:
+        found, rules = self._rules.get(user_id)
+        if not found:
+            delete_words, replace_words = await db.get_word_rules(user_id)
+            rules = WordRewriter(delete_words, replace_words) if delete_words or replace_words else None
+            self._rules.put(user_id, rules)
+        return rules
+
+    def invalidate(self, user_id: int) -> None:
+        self._rules.invalidate(user_id)
+
+
+word_cache = WordCache(USER_CACHE_SIZE, USER_CACHE_TTL)
 
 @Client.on_message(filters.command("set_del_word") & filters.private)
 async def set_del_word(client: Client, message: Message):
@@ -13,6 +123,7 @@ async def set_del_word(client: Client, message: Message):
     
     words = message.command[1:]
     await db.set_delete_words(message.from_user.id, words)
+    word_cache.invalidate(message.from_user.id)
     await message.reply_text(f"**Added {len(words)} words to delete list.**")
 
 @Client.on_message(filters.command("rem_del_word") & filters.private)
@@ -22,6 +133,7 @@ async def rem_del_word(client: Client, message: Message):
     
     words = message.command[1:]
     await db.remove_delete_words(message.from_user.id, words)
+    word_cache.invalidate(message.from_user.id)
     await message.reply_text(f"**Removed {len(words)} words from delete list.**")
 # Rexbots
 # Don't Remove Credit
@@ -37,6 +149,7 @@ async def set_repl_word(client: Client, message: Message):
     replacement = message.command[2]
     
     await db.set_replace_words(message.from_user.id, {target: replacement})
+    word_cache.invalidate(message.from_user.id)
     await message.reply_text(f"**Set replacement:** `{target}` -> `{replacement}`")
 
 @Client.on_message(filters.command("rem_repl_word") & filters.private)
@@ -46,6 +159,7 @@ async def rem_repl_word(client: Client, message: Message):
     
     target = message.command[1]
     await db.remove_replace_words(message.from_user.id, [target])
+    word_cache.invalidate(message.from_user.id)
     await message.reply_text(f"**Removed replacement for:** `{target}`")
 
 # Rexbots
@@ -4,11 +4,16 @@ import sys
 import os
 from datetime import timezone, timedelta
 
-from pyrogram import Client, filters, enums, __version__ as pyrogram_version
-from pyrogram.types import Message
+from pyrogram import Client, enums, __version__ as pyrogram_version
 
 from config import API_ID, API_HASH, BOT_TOKEN, LOG_CHANNEL
 from database.db import db
+from Rexbots.session_pool import session_pool
+from Rexbots.spool import spool
+from Rexbots.start import resume_jobs
+from Rexbots.ledger import usage_ledger
+from Rexbots.premium import premium_sweeper
+from Rexbots.stats import stats_snapshot
 from logger import LOGGER
 
 # ✅ Keep-alive server (For Render / Heroku)
@@ -75,6 +80,40 @@ class Bot(Client):
             except Exception as e:
                 logger.warning(f"Keep-alive failed to start: {e}")
 
+        # 🔹 Ensure DB indexes (incl. TTL eviction for the file cache)
+        try:
+            await db.ensure_indexes()
+        except Exception as e:
+            logger.warning(f"Failed to ensure DB indexes: {e}")
+
+        # 🔹 Reclaim temp files left behind by a previous run
+        try:
+            await spool.reclaim_orphans()
+        except Exception as e:
+            logger.warning(f"Spool cleanup failed: {e}")
+
+        # 🔹 Warm the known-user index (new-user hook skips existing users)
+        try:
+            known = await db.warm_known_users()
+            logger.info(f"Known-user index warmed: {known} users")
+        except Exception as e:
+            logger.warning(f"Failed to warm known-user index: {e}")
+
+        # 🔹 Compute the first global stats snapshot (then refreshed in the background)
+        try:
+            await stats_snapshot.get()
+        except Exception as e:
+            logger.warning(f"Failed to compute stats snapshot: {e}")
+
+        # 🔹 Expire lapsed premium plans in the background
+        self.premium_sweeper = asyncio.create_task(premium_sweeper())
+
+        # 🔹 Resume batches interrupted by the last restart
+        try:
+            await resume_jobs(self)
+        except Exception as e:
+            logger.warning(f"Failed to resume batch jobs: {e}")
+
         # 🔹 Log DB stats
         user_count = await db.total_users_count()
         logger.info(f"Connected to MongoDB Database: {db.db.name}")
@@ -137,55 +176,24 @@ class Bot(Client):
         except Exception as e:
             logger.error(f"Failed to send stop log: {e}")
 
+        # 🔹 Stop the premium sweeper
+        if getattr(self, "premium_sweeper", None):
+            self.premium_sweeper.cancel()
+
+        # 🔹 Write out buffered usage counters
+        try:
+            await usage_ledger.close()
+        except Exception as e:
+            logger.error(f"Failed to flush usage ledger: {e}")
+
+        # 🔹 Disconnect pooled user sessions
+        await session_pool.close()
+
         await super().stop()
         logger.info("Bot stopped cleanly")
 
 
 BotInstance = Bot()
 
-# ========================================================
-# ✅ NEW USER LOGGER
-# Logs only on FIRST interaction
-# ========================================================
-@BotInstance.on_message(filters.private & filters.incoming, group=-1)
-async def new_user_log(bot: Client, message: Message):
-    user = message.from_user
-    if not user:
-        return
-
-    # 1. Check if user exists
-    if await db.is_user_exist(user.id):
-        return
-
-    # 2. Add user if not exists
-    await db.add_user(user.id, user.first_name)
-
-    # 3. Log the new user
-    now = datetime.datetime.now(IST)
-    username_text = f"@{user.username}" if user.username else "<i>None</i>"
-
-    new_user_text = (
-        f"<b><i>#NewUser 👤 Joined the Bot</i></b>\n\n"
-        f"<b>Bot:</b> @{bot.me.username}\n\n"
-        f"<b>User:</b> {user.mention(style='html')}\n"
-        f"<b>Username:</b> {username_text}\n"
-        f"<b>User ID:</b> <code>{user.id}</code>\n\n"
-        f"<b>📅 Date:</b> <code>{now.strftime('%d %B %Y')}</code>\n"
-        f"<b>🕒 Time:</b> <code>{now.strftime('%I:%M %p')} IST</code>\n\n"
-        f"<b>Developed by @RexBots_Official</b>"
-    )
-
-    try:
-        await bot.send_message(
-            LOG_CHANNEL,
-            new_user_text,
-            parse_mode=enums.ParseMode.HTML,
-            disable_web_page_preview=True
-        )
-        logger.info(f"New user logged: {user.id} - {user.first_name}")
-    except Exception as e:
-        logger.error(f"Failed to log new user {user.id}: {e}")
-
-
 if __name__ == "__main__":
     BotInstance.run()
@@ -27,3 +27,71 @@ KEEP_ALIVE_URL = os.environ.get("KEEP_ALIVE_URL", "")
 # Rexbots
 # Don't Remove Credit
 # Telegram Channel @RexBots_Official
+
+# User session pool (connected clients reused across messages)
+SESSION_POOL_MAX = int(os.environ.get("SESSION_POOL_MAX", "50"))
+SESSION_POOL_PER_USER = int(os.environ.get("SESSION_POOL_PER_USER", "2"))
+SESSION_POOL_TTL = int(os.environ.get("SESSION_POOL_TTL", "600"))
+
+# Batch pipeline: queue depth in front of each stage (backpressure)
+PIPELINE_PREPARE_DEPTH = int(os.environ.get("PIPELINE_PREPARE_DEPTH", "4"))
+PIPELINE_DOWNLOAD_DEPTH = int(os.environ.get("PIPELINE_DOWNLOAD_DEPTH", "2"))
+PIPELINE_UPLOAD_DEPTH = int(os.environ.get("PIPELINE_UPLOAD_DEPTH", "1"))
+
+# Batch planner: message ids fetched per get_messages call (max 200)
+PLANNER_CHUNK_SIZE = int(os.environ.get("PLANNER_CHUNK_SIZE", "200"))
+
+# Streaming relay: stream media from the user session straight into the bot upload
+RELAY_MODE = os.environ.get("RELAY_MODE", "True").lower() in ("true", "1", "yes")
+RELAY_BUFFER_CHUNKS = int(os.environ.get("RELAY_BUFFER_CHUNKS", "8"))  # 1 MiB each
+
+# Delivered-file cache: drop entries unused for this many seconds (default 30 days)
+FILE_CACHE_TTL = int(os.environ.get("FILE_CACHE_TTL", str(30 * 24 * 3600)))
+
+# Download spool: root directory and total byte budget for temporary files
+SPOOL_DIR = os.environ.get("SPOOL_DIR", "downloads")
+SPOOL_MAX_BYTES = int(os.environ.get("SPOOL_MAX_BYTES", str(8 * 1024 * 1024 * 1024)))
+
+# Progress bus: minimum seconds between status message edits per chat
+PROGRESS_EDIT_INTERVAL = float(os.environ.get("PROGRESS_EDIT_INTERVAL", "3"))
+
+# Transfer scheduler: batches running at once, globally and per user
+SCHEDULER_MAX_ACTIVE = int(os.environ.get("SCHEDULER_MAX_ACTIVE", "6"))
+SCHEDULER_PER_USER = int(os.environ.get("SCHEDULER_PER_USER", "1"))
+SCHEDULER_PER_USER_PREMIUM = int(os.environ.get("SCHEDULER_PER_USER_PREMIUM", "2"))
+# Premium batches started in a row before one waiting free batch goes next
+SCHEDULER_PREMIUM_WEIGHT = int(os.environ.get("SCHEDULER_PREMIUM_WEIGHT", "3"))
+
+# Parallel ranged downloader: files from this size are fetched in concurrent ranges
+RANGED_MIN_SIZE = int(os.environ.get("RANGED_MIN_SIZE", str(20 * 1024 * 1024)))
+RANGED_PART_CHUNKS = int(os.environ.get("RANGED_PART_CHUNKS", "16"))  # 1 MiB chunks per range
+RANGED_MIN_WORKERS = int(os.environ.get("RANGED_MIN_WORKERS", "2"))
+RANGED_MAX_WORKERS = int(os.environ.get("RANGED_MAX_WORKERS", "8"))
+
+# Upload engine: parts in flight per file and media sessions used by big files
+UPLOAD_PARALLEL_PARTS = int(os.environ.get("UPLOAD_PARALLEL_PARTS", "8"))
+UPLOAD_SESSIONS = int(os.environ.get("UPLOAD_SESSIONS", "2"))
+
+# Transfer retries: attempts per range/part/upload and full-jitter backoff bounds (seconds)
+TRANSFER_RETRIES = int(os.environ.get("TRANSFER_RETRIES", "5"))
+TRANSFER_RETRY_BASE = float(os.environ.get("TRANSFER_RETRY_BASE", "1"))
+TRANSFER_RETRY_MAX = float(os.environ.get("TRANSFER_RETRY_MAX", "30"))
+
+# Custom thumbnail cache: normalized per-user thumbnails live here
+THUMB_CACHE_DIR = os.environ.get("THUMB_CACHE_DIR", "thumbs")
+
+# User document cache: max cached users and seconds before a cached copy is re-read
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "5000"))
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", "60"))
+
+# Free plan: files per 24h window (premium users are not counted)
+FREE_DAILY_LIMIT = int(os.environ.get("FREE_DAILY_LIMIT", "10"))
+
+# Usage ledger: seconds between write-behind flushes of per-user usage counters
+USAGE_FLUSH_INTERVAL = int(os.environ.get("USAGE_FLUSH_INTERVAL", "30"))
+
+# Premium sweeper: seconds between passes that switch off expired plans
+PREMIUM_SWEEP_INTERVAL = int(os.environ.get("PREMIUM_SWEEP_INTERVAL", "300"))
+
+# Global stats snapshot: seconds between background refreshes of the /stats numbers
+STATS_REFRESH_INTERVAL = int(os.environ.get("STATS_REFRESH_INTERVAL", "60"))
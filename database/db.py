@@ -1,11 +1,122 @@
 import motor.motor_asyncio
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 import datetime
-from typing import Optional, Dict, List, Any
-from config import DB_NAME, DB_URI
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Optional, Dict, List, Any, Tuple
+from config import DB_NAME, DB_URI, FILE_CACHE_TTL, USER_CACHE_SIZE, USER_CACHE_TTL, FREE_DAILY_LIMIT
 from logger import LOGGER
 
 logger = LOGGER(__name__)
 
+USAGE_FLUSH_MARKS = 10  # Recent ledger flush ids kept per document (see apply_usage)
+
+class UserCache:
+    """
+    Size-bounded LRU of user documents with a TTL, so one transfer reads
+    the user's document from Mongo once instead of once per accessor.
+    Absent users are cached too (as None) until add_user() runs.
+    """
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max(max_size, 1)
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()  # id -> (expires, doc)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, id: int) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        entry = self._entries.get(id)
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(id, None)
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(id)
+        self.hits += 1
+        return True, entry[1]
+
+    def put(self, id: int, doc: Optional[Dict[str, Any]]) -> None:
+        self._entries[id] = (time.monotonic() + self.ttl, doc)
+        self._entries.move_to_end(id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def patch(self, id: int, fields: Dict[str, Any]) -> None:
+        entry = self._entries.get(id)
+        if entry and entry[1] is not None:
+            entry[1].update(fields)
+        else:
+            self._entries.pop(id, None)
+
+    def increment(self, id: int, fields: Dict[str, Any]) -> None:
+        entry = self._entries.get(id)
+        if entry and entry[1] is not None:
+            for key, value in fields.items():
+                entry[1][key] = entry[1].get(key, 0) + value
+
+    def invalidate(self, id: int) -> None:
+        self._entries.pop(id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class KnownUsers:
+    """
+    Compact membership index of every user id in the database: a sorted
+    int64 array (8 bytes per user) plus a small set of ids added since the
+    last merge. Until warm() has run, membership is unknown (`ready` is False).
+    """
+    MERGE_AT = 1024
+
+    def __init__(self):
+        self._ids = array('q')
+        self._recent = set()
+        self._removed = set()
+        self.ready = False
+
+    def warm(self, ids: List[int]) -> None:
+        self._ids = array('q', sorted(set(ids)))
+        self._recent.clear()
+        self._removed.clear()
+        self.ready = True
+
+    def __contains__(self, id: int) -> bool:
+        if id in self._recent:
+            return True
+        if id in self._removed:
+            return False
+        i = bisect_left(self._ids, id)
+        return i < len(self._ids) and self._ids[i] == id
+
+    def __len__(self) -> int:
+        return len(self._ids) + len(self._recent) - len(self._removed)
+
+    def add(self, id: int) -> None:
+        self._removed.discard(id)
+        if id in self:
+            return
+        self._recent.add(id)
+        if len(self._recent) >= self.MERGE_AT:
+            self._merge()
+
+    def discard(self, id: int) -> None:
+        if id in self._recent:
+            self._recent.discard(id)
+        elif id in self:
+            self._removed.add(id)
+
+    def _merge(self) -> None:
+        merged = set(self._ids)
+        merged.difference_update(self._removed)
+        merged.update(self._recent)
+        self._ids = array('q', sorted(merged))
+        self._recent.clear()
+        self._removed.clear()
+
+
 class Database:
     def __init__(self, uri: str, database_name: str):
         """
@@ -14,6 +125,13 @@ class Database:
         self._client = motor.motor_asyncio.AsyncIOMotorClient(uri)
         self.db = self._client[database_name]
         self.col = self.db.users
+        self.files = self.db.file_cache
+        self.jobs = self.db.jobs
+        self.usage = self.db.usage_daily
+        self.file_cache_hits = 0
+        self.users = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+        self.known_users = KnownUsers()
+        self.file_cache_misses = 0
 
     async def ensure_indexes(self) -> None:
         """
@@ -22,9 +140,39 @@ class Database:
         """
         await self.col.create_index('id', unique=True)
         await self.col.create_index('is_premium')
+        await self.col.create_index([('is_premium', 1), ('premium_expiry', 1)])
         await self.col.create_index('is_banned')
+        await self.files.create_index([('file_unique_id', 1), ('variant', 1)], unique=True)
+        await self.files.create_index('sources')
+        await self.files.create_index('last_used', expireAfterSeconds=FILE_CACHE_TTL)
+        await self.jobs.create_index('status')
+        await self.usage.create_index([('user_id', 1), ('day', 1)], unique=True)
         logger.info("Database indexes ensured.")
 
+    # User Document Cache
+    # All per-user reads go through _get_user(); writes go through
+    # _update_user(), which patches the cached copy for plain $set updates
+    # and drops it for anything else.
+    async def _get_user(self, id: int) -> Optional[Dict[str, Any]]:
+        found, user = self.users.get(id)
+        if not found:
+            user = await self.col.find_one({'id': id})
+            self.users.put(id, user)
+        return user
+
+    async def _update_user(self, id: int, update: Dict[str, Any]) -> None:
+        await self.col.update_one({'id': id}, update)
+        if set(update) == {'$set'}:
+            self.users.patch(id, update['$set'])
+        else:
+            self.users.invalidate(id)
+
+    def user_cache_stats(self) -> Dict[str, int]:
+        """
+        Returns the user cache size and hit/miss counters.
+        """
+        return self.users.stats()
+
     def new_user(self, id: int, name: str) -> Dict[str, Any]:
         """
         Creates a new user dictionary with all default fields.
@@ -42,26 +190,76 @@ class Database:
             'delete_words': [],
             'replace_words': {},
             'daily_usage': 0,
-            'limit_reset_time': None
+            'limit_reset_time': None,
+            'total_saves': 0,
+            'total_bytes': 0,
+            'total_seconds': 0
         }
 
+    async def warm_known_users(self) -> int:
+        """
+        Loads every user id into the known-user index with a covered scan of
+        the `id` index (no documents are read). Returns the number of ids.
+        """
+        ids = [
+            doc['id'] async for doc in
+            self.col.find({}, {'id': 1, '_id': 0}).hint([('id', 1)]).batch_size(10000)
+        ]
+        self.known_users.warm(ids)
+        return len(ids)
+
     async def add_user(self, id: int, name: str) -> None:
         """
-        Adds a new user to the database.
+        Adds a new user to the database (no-op if the user already exists).
         """
-        user = self.new_user(id, name)
+        defaults = self.new_user(id, name)
+        defaults.pop('id')
         try:
-            await self.col.insert_one(user)
-            logger.info(f"New user added to DB: {id} - {name}")
+            result = await self.col.update_one({'id': id}, {'$setOnInsert': defaults}, upsert=True)
+            self.known_users.add(id)
+            self.users.invalidate(id)
+            if result.upserted_id is not None:
+                logger.info(f"New user added to DB: {id} - {name}")
         except Exception as e:
             logger.error(f"Error adding user {id}: {e}")
             raise
 
+    async def load_user(self, id: int, name: str) -> Tuple[Dict[str, Any], bool]:
+        """
+        Upserts a user and returns (document, created) in one round trip,
+        seeding the user cache with the document.
+        """
+        found, user = self.users.get(id)
+        if found and user is not None:
+            return user, False
+        defaults = self.new_user(id, name)
+        defaults.pop('id')
+        before = await self.col.find_one_and_update(
+            {'id': id},
+            {'$setOnInsert': defaults},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+        created = before is None
+        user = self.new_user(id, name) if created else before
+        self.users.put(id, user)
+        self.known_users.add(id)
+        return user, created
+
+    def is_known_user(self, id: int) -> bool:
+        """
+        True if the id is in the warmed known-user index (no DB access).
+        """
+        return self.known_users.ready and id in self.known_users
+
     async def is_user_exist(self, id: int) -> bool:
         """
         Checks if a user exists in the database.
+        Answered from the known-user index once it is warm.
         """
-        user = await self.col.find_one({'id': id})
+        if self.known_users.ready:
+            return id in self.known_users
+        user = await self._get_user(id)
         return bool(user)
 
     async def total_users_count(self) -> int:
@@ -82,68 +280,105 @@ class Database:
         Deletes a user from the database.
         """
         await self.col.delete_many({'id': user_id})
+        self.users.invalidate(user_id)
+        self.known_users.discard(user_id)
         logger.info(f"User deleted from DB: {user_id}")
 
     async def set_session(self, id: int, session: Optional[str]) -> None:
         """
         Sets the session for a user.
         """
-        await self.col.update_one({'id': id}, {'$set': {'session': session}})
+        await self._update_user(id, {'$set': {'session': session}})
 
     async def get_session(self, id: int) -> Optional[str]:
         """
         Gets the session for a user.
         """
-        user = await self.col.find_one({'id': id})
+        user = await self._get_user(id)
         return user.get('session') if user else None
 
     # Caption Support
-    async def set_caption(self, id: int, caption: Optional[str]) -> None:
+    async def set_caption(self, id: int, caption: Optional[str], compiled: Optional[List[Any]] = None) -> None:
         """
-        Sets the caption for a user.
+        Sets the caption for a user, with its compiled form (see Rexbots/caption.py).
         """
-        await self.col.update_one({'id': id}, {'$set': {'caption': caption}})
+        await self._update_user(id, {'$set': {'caption': caption, 'caption_compiled': compiled}})
 
     async def get_caption(self, id: int) -> Optional[str]:
         """
         Gets the caption for a user.
         """
-        user = await self.col.find_one({'id': id})
+        user = await self._get_user(id)
         return user.get('caption', None) if user else None
 
+    async def get_caption_compiled(self, id: int) -> Optional[Dict[str, Any]]:
+        """
+        Gets the caption template and its compiled form for a user.
+        """
+        user = await self._get_user(id)
+        return {'caption': user.get('caption'), 'caption_compiled': user.get('caption_compiled')} if user else None
+
     async def del_caption(self, id: int) -> None:
         """
         Deletes the caption for a user.
         """
-        await self.col.update_one({'id': id}, {'$unset': {'caption': 1}})
+        await self._update_user(id, {'$unset': {'caption': 1, 'caption_compiled': 1}})
 
     # Thumbnail Support
     async def set_thumbnail(self, id: int, thumbnail: Optional[str]) -> None:
         """
         Sets the thumbnail for a user.
         """
-        await self.col.update_one({'id': id}, {'$set': {'thumbnail': thumbnail}})
+        await self._update_user(id, {'$set': {'thumbnail': thumbnail}})
 
     async def get_thumbnail(self, id: int) -> Optional[str]:
         """
         Gets the thumbnail for a user.
         """
-        user = await self.col.find_one({'id': id})
+        user = await self._get_user(id)
         return user.get('thumbnail', None) if user else None
 
     async def del_thumbnail(self, id: int) -> None:
         """
         Deletes the thumbnail for a user.
         """
-        await self.col.update_one({'id': id}, {'$unset': {'thumbnail': 1}})
+        await self._update_user(id, {'$unset': {'thumbnail': 1}})
 
     # Premium Support
-    async def add_premium(self, id: int, expiry_date: datetime.datetime) -> None:
+    # premium_expiry is stored as a datetime (None = permanent). Expired
+    # plans are switched off by the background sweeper (expire_premiums), so
+    # every plan check is a pure read of the (cached) user document.
+    @staticmethod
+    def normalize_expiry(value: Any) -> Optional[datetime.datetime]:
         """
-        Grants premium status to a user until the expiry date.
+        Coerces a stored or admin-given expiry (datetime, date or ISO string) to a datetime.
+        """
+        if value is None or isinstance(value, datetime.datetime):
+            return value
+        if isinstance(value, datetime.date):
+            return datetime.datetime.combine(value, datetime.time.min)
+        return datetime.datetime.fromisoformat(str(value).strip())
+
+    @staticmethod
+    def premium_active(user: Optional[Dict[str, Any]], now: Optional[datetime.datetime] = None) -> bool:
+        """
+        True if the document carries an unexpired (or permanent) premium plan.
+        """
+        if not user or not user.get('is_premium'):
+            return False
+        expiry = user.get('premium_expiry')
+        if expiry is None:
+            return True
+        # Legacy string expiries count as expired until the sweeper normalizes them
+        return isinstance(expiry, datetime.datetime) and (now or datetime.datetime.now()) < expiry
+
+    async def add_premium(self, id: int, expiry_date: Any) -> None:
+        """
+        Grants premium status to a user until the expiry date (None = permanent).
         Resets daily limits.
         """
-        await self.col.update_one({'id': id}, {
+        expiry_date = self.normalize_expiry(expiry_date)
+        await self._update_user(id, {
             '$set': {
                 'is_premium': True,
                 'premium_expiry': expiry_date,
@@ -157,14 +392,14 @@ class Database:
         """
         Removes premium status from a user.
         """
-        await self.col.update_one({'id': id}, {'$set': {'is_premium': False, 'premium_expiry': None}})
+        await self._update_user(id, {'$set': {'is_premium': False, 'premium_expiry': None}})
         logger.info(f"User {id} removed from premium")
 
     async def check_premium(self, id: int) -> Optional[datetime.datetime]:
         """
         Checks if a user is premium and returns expiry if true, else None.
         """
-        user = await self.col.find_one({'id': id})
+        user = await self._get_user(id)
         if user and user.get('is_premium'):
             return user.get('premium_expiry')
         return None
@@ -172,17 +407,40 @@ class Database:
     async def is_premium(self, id: int) -> bool:
         """
         Checks if a user is premium and if the premium has not expired.
-        Automatically removes premium if expired.
+        Read-only; expired plans are cleared by expire_premiums().
         """
-        user = await self.col.find_one({'id': id})
-        if user and user.get('is_premium', False):
-            expiry = user.get('premium_expiry')
-            if expiry and datetime.datetime.now() < expiry:
-                return True
-            else:
-                await self.remove_premium(id)
-                return False
-        return False
+        return self.premium_active(await self._get_user(id))
+
+    async def normalize_premium_expiries(self) -> int:
+        """
+        Rewrites expiries stored as strings (older /add_premium) as datetimes.
+        Unparseable values are cleared to expire on the next sweep.
+        """
+        updates = []
+        async for user in self.col.find({'premium_expiry': {'$type': 'string'}}, {'id': 1, 'premium_expiry': 1}):
+            try:
+                expiry = self.normalize_expiry(user['premium_expiry'])
+                update = {'$set': {'premium_expiry': expiry}}
+            except ValueError:
+                logger.warning(f"User {user['id']} has an invalid premium expiry {user['premium_expiry']!r}, revoking")
+                update = {'$set': {'is_premium': False, 'premium_expiry': None}}
+            updates.append(UpdateOne({'_id': user['_id']}, update))
+            self.users.invalidate(user['id'])
+        if updates:
+            await self.col.bulk_write(updates, ordered=False)
+        return len(updates)
+
+    async def expire_premiums(self) -> int:
+        """
+        Switches off every premium plan whose expiry has passed, in one update_many.
+        Returns the number of users downgraded.
+        """
+        result = await self.col.update_many(
+            {'is_premium': True, 'premium_expiry': {'$lte': datetime.datetime.now()}},
+            {'$set': {'is_premium': False, 'premium_expiry': None}}
+        )
+        # Cached copies need no invalidation: premium_active() already treats them as expired
+        return result.modified_count
 
     def get_premium_users(self):
         """
@@ -202,21 +460,21 @@ class Database:
         """
         Bans a user.
         """
-        await self.col.update_one({'id': id}, {'$set': {'is_banned': True}})
+        await self._update_user(id, {'$set': {'is_banned': True}})
         logger.warning(f"User banned: {id}")
 
     async def unban_user(self, id: int) -> None:
         """
         Unbans a user.
         """
-        await self.col.update_one({'id': id}, {'$set': {'is_banned': False}})
+        await self._update_user(id, {'$set': {'is_banned': False}})
         logger.info(f"User unbanned: {id}")
 
     async def is_banned(self, id: int) -> bool:
         """
         Checks if a user is banned.
         """
-        user = await self.col.find_one({'id': id})
+        user = await self._get_user(id)
         return user.get('is_banned', False) if user else False
 
     def get_banned_users(self):
@@ -237,13 +495,13 @@ class Database:
         """
         Sets the dump chat for a user.
         """
-        await self.col.update_one({'id': id}, {'$set': {'dump_chat': chat_id}})
+        await self._update_user(id, {'$set': {'dump_chat': chat_id}})
 
     async def get_dump_chat(self, id: int) -> Optional[int]:
         """
         Gets the dump chat for a user.
         """
-        user = await self.col.find_one({'id': id})
+        user = await self._get_user(id)
         return user.get('dump_chat', None) if user else None
 
     # Delete/Replace Words Support
@@ -251,111 +509,412 @@ class Database:
         """
         Adds words to the delete list for a user.
         """
-        await self.col.update_one({'id': id}, {'$addToSet': {'delete_words': {'$each': words}}})
+        await self._update_user(id, {'$addToSet': {'delete_words': {'$each': words}}})
 
     async def get_delete_words(self, id: int) -> List[str]:
         """
         Gets the delete words for a user.
         """
-        user = await self.col.find_one({'id': id})
+        user = await self._get_user(id)
         return user.get('delete_words', []) if user else []
 
     async def remove_delete_words(self, id: int, words: List[str]) -> None:
         """
         Removes words from the delete list for a user.
         """
-        await self.col.update_one({'id': id}, {'$pull': {'delete_words': {'$in': words}}})
+        await self._update_user(id, {'$pull': {'delete_words': {'$in': words}}})
 
     async def set_replace_words(self, id: int, repl_dict: Dict[str, str]) -> None:
         """
         Updates the replace words dictionary for a user.
         """
-        user = await self.col.find_one({'id': id})
+        user = await self._get_user(id)
         if user:
-            current_repl = user.get('replace_words', {})
+            current_repl = dict(user.get('replace_words') or {})
             current_repl.update(repl_dict)
-            await self.col.update_one({'id': id}, {'$set': {'replace_words': current_repl}})
+            await self._update_user(id, {'$set': {'replace_words': current_repl}})
 
     async def get_replace_words(self, id: int) -> Dict[str, str]:
         """
         Gets the replace words for a user.
         """
-        user = await self.col.find_one({'id': id})
+        user = await self._get_user(id)
         return user.get('replace_words', {}) if user else {}
 
+    async def get_word_rules(self, id: int) -> Tuple[List[str], Dict[str, str]]:
+        """
+        Gets the delete words and replace words for a user in one query.
+        """
+        user = await self._get_user(id)
+        if not user:
+            return [], {}
+        return user.get('delete_words') or [], user.get('replace_words') or {}
+
     async def remove_replace_words(self, id: int, words: List[str]) -> None:
         """
         Removes keys from the replace words dictionary for a user.
         """
-        user = await self.col.find_one({'id': id})
+        user = await self._get_user(id)
         if user:
-            current_repl = user.get('replace_words', {})
+            current_repl = dict(user.get('replace_words') or {})
             for w in words:
                 current_repl.pop(w, None)
-            await self.col.update_one({'id': id}, {'$set': {'replace_words': current_repl}})
+            await self._update_user(id, {'$set': {'replace_words': current_repl}})
 
     # Daily Limits (Free User Restriction)
+    @staticmethod
+    def quota_state(user: Optional[Dict[str, Any]], now: datetime.datetime, limit: int) -> Tuple[bool, int, Optional[datetime.datetime]]:
+        """
+        Applies one file to a user document without touching Mongo.
+        Returns (granted, daily_usage, limit_reset_time) after the file;
+        mirrors the update pipeline in consume_quota().
+        """
+        if not user:
+            return True, 0, None  # Should be added via load_user, but safe fallback
+        usage = user.get('daily_usage', 0)
+        reset_time = user.get('limit_reset_time')
+        # 1. Premium: always allowed, nothing counted
+        if Database.premium_active(user, now):
+            return True, usage, reset_time
+        # 2. Window never started or already over: this file opens a new 24h window
+        if reset_time is None or now >= reset_time:
+            return True, 1, now + datetime.timedelta(hours=24)
+        # 3. Inside the window: count the file if there is room left
+        if usage < limit:
+            return True, usage + 1, reset_time
+        return False, usage, reset_time
+
     async def check_limit(self, id: int) -> bool:
         """
-        Checks if a user has hit their daily limit.
+        Checks if a user has hit their daily limit (read-only peek).
         Returns: True if BLOCKED (limit reached), False if ALLOWED.
         """
-        user = await self.col.find_one({'id': id})
-        if not user:
-            return False  # Should be added via add_user, but safe fallback
+        user = await self._get_user(id)
+        granted, _, _ = self.quota_state(user, datetime.datetime.now(), FREE_DAILY_LIMIT)
+        return not granted
+
+    @staticmethod
+    def _premium_expr(now: datetime.datetime) -> Dict[str, Any]:
+        """Aggregation form of premium_active() for update pipelines."""
+        return {'$and': [
+            {'$eq': ['$is_premium', True]},
+            {'$or': [
+                {'$eq': [{'$ifNull': ['$premium_expiry', None]}, None]},
+                {'$and': [
+                    {'$eq': [{'$type': '$premium_expiry'}, 'date']},
+                    {'$lt': [now, '$premium_expiry']}
+                ]}
+            ]}
+        ]}
+
+    async def consume_quota(self, id: int) -> Tuple[bool, int, Optional[datetime.datetime]]:
+        """
+        Atomically checks and counts one file against the user's daily quota:
+        window reset, premium bypass and increment in a single
+        find_one_and_update, so concurrent batches cannot overshoot the limit.
+        Returns (granted, daily_usage, limit_reset_time) after the call.
+        """
+        now = datetime.datetime.now()
+        limit = FREE_DAILY_LIMIT
+        premium = self._premium_expr(now)
+        window_over = {'$or': [
+            {'$eq': [{'$ifNull': ['$limit_reset_time', None]}, None]},
+            {'$gte': [now, '$limit_reset_time']}
+        ]}
+        usage = {'$ifNull': ['$daily_usage', 0]}
+        before = await self.col.find_one_and_update(
+            {'id': id},
+            [{'$set': {
+                'daily_usage': {'$switch': {'branches': [
+                    {'case': premium, 'then': '$daily_usage'},
+                    {'case': window_over, 'then': 1},
+                    {'case': {'$lt': [usage, limit]}, 'then': {'$add': [usage, 1]}}
+                ], 'default': usage}},
+                'limit_reset_time': {'$switch': {'branches': [
+                    {'case': premium, 'then': '$limit_reset_time'},
+                    {'case': window_over, 'then': now + datetime.timedelta(hours=24)}
+                ], 'default': '$limit_reset_time'}}
+            }}],
+            return_document=ReturnDocument.BEFORE
+        )
+        # Same rules applied to the pre-update document give the outcome
+        granted, usage_after, reset_after = self.quota_state(before, now, limit)
+        if before is not None:
+            self.users.patch(id, {'daily_usage': usage_after, 'limit_reset_time': reset_after})
+        return granted, usage_after, reset_after
+
+    async def refund_quota(self, id: int, window: Optional[datetime.datetime]) -> None:
+        """
+        Gives back one file counted by consume_quota() when nothing was delivered.
+        Only the window the file was counted in is refunded; premium users and
+        windows that have since reset are left alone.
+        """
+        if window is None:
+            return
+        now = datetime.datetime.now()
+        after = await self.col.find_one_and_update(
+            {'id': id, 'limit_reset_time': window},
+            [{'$set': {'daily_usage': {'$cond': [
+                {'$or': [self._premium_expr(now), {'$lte': [{'$ifNull': ['$daily_usage', 0]}, 0]}]},
+                '$daily_usage',
+                {'$subtract': ['$daily_usage', 1]}
+            ]}}}],
+            return_document=ReturnDocument.AFTER
+        )
+        if after is not None:
+            self.users.patch(id, {'daily_usage': after.get('daily_usage', 0)})
+
+    # Delivered File Cache
+    # Maps a source message / file_unique_id to the bot-side file_id of the
+    # first upload, per thumbnail variant, so repeat requests skip the transfer.
+    async def get_cached_file(self, source: str, file_unique_id: str, variant: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Looks up a delivered file by file_unique_id, falling back to the source
+        key ("chat:msgid") only when no file_unique_id is known. A source whose
+        media was replaced must not resolve to the old file.
+        """
+        if file_unique_id:
+            query = {'file_unique_id': file_unique_id, 'variant': variant}
+        else:
+            query = {'sources': source, 'variant': variant}
+        entry = await self.files.find_one(query)
+        if entry:
+            self.file_cache_hits += 1
+            await self.files.update_one(
+                {'_id': entry['_id']},
+                {'$inc': {'hits': 1}, '$set': {'last_used': datetime.datetime.now()}, '$addToSet': {'sources': source}}
+            )
+        else:
+            self.file_cache_misses += 1
+        return entry
 
-        # 1. Premium Check: Always allowed if active premium
-        if await self.is_premium(id):
-            return False
+    async def cache_file(self, source: str, file_unique_id: str, variant: Optional[str], file_id: str, msg_type: str) -> None:
+        """
+        Records the bot-side file_id of a freshly delivered file.
+        """
+        now = datetime.datetime.now()
+        await self.files.update_one(
+            {'file_unique_id': file_unique_id, 'variant': variant},
+            {
+                '$set': {'file_id': file_id, 'type': msg_type, 'last_used': now},
+                '$setOnInsert': {'created': now, 'hits': 0},
+                '$addToSet': {'sources': source}
+            },
+            upsert=True
+        )
+
+    async def drop_cached_file(self, file_unique_id: str, variant: Optional[str]) -> None:
+        """
+        Evicts a cache entry whose file reference is no longer usable.
+        """
+        await self.files.delete_one({'file_unique_id': file_unique_id, 'variant': variant})
+        logger.info(f"Dropped stale cached file {file_unique_id} ({variant})")
+
+    async def file_cache_stats(self) -> Dict[str, int]:
+        """
+        Returns cache size and this process's hit/miss counters.
+        """
+        return {
+            'entries': await self.files.estimated_document_count(),
+            'hits': self.file_cache_hits,
+            'misses': self.file_cache_misses
+        }
 
-        # 2. Check Time Reset
+    # Batch Jobs
+    # One document per link a user sends. `cursor` is the last delivered
+    # message id, so an unfinished batch resumes after a restart.
+    async def create_job(self, user_id: int, chat_id: int, request_id: int, source: Any,
+                         from_id: int, to_id: int, needs_login: bool, settings: Dict[str, Any]) -> Any:
+        """
+        Records a new batch and returns its _id.
+        """
         now = datetime.datetime.now()
-        reset_time = user.get('limit_reset_time')
-        # If reset time has passed or was never set, reset count to 0
-        if reset_time is None or now >= reset_time:
-            await self.col.update_one(
-                {'id': id},
-                {'$set': {'daily_usage': 0, 'limit_reset_time': None}}
-            )
-            return False  # Allowed (count is 0)
+        result = await self.jobs.insert_one({
+            'user_id': user_id,
+            'chat_id': chat_id,
+            'request_id': request_id,
+            'source': source,
+            'from_id': from_id,
+            'to_id': to_id,
+            'needs_login': needs_login,
+            'settings': settings,
+            'cursor': None,
+            'status': 'queued',
+            'created': now,
+            'updated': now
+        })
+        return result.inserted_id
 
-        # 3. Check Count
-        usage = user.get('daily_usage', 0)
-        if usage >= 10:
-            return True  # Blocked
-        return False  # Allowed
+    async def set_job_status(self, job_id: Any, status: str) -> None:
+        """
+        Marks a batch queued, running, done, cancelled or failed.
+        """
+        await self.jobs.update_one(
+            {'_id': job_id}, {'$set': {'status': status, 'updated': datetime.datetime.now()}}
+        )
+
+    async def advance_job(self, job_id: Any, msgid: int) -> None:
+        """
+        Moves a batch's checkpoint forward to `msgid` (never backwards).
+        """
+        await self.jobs.update_one(
+            {'_id': job_id},
+            {'$max': {'cursor': msgid}, '$set': {'updated': datetime.datetime.now()}}
+        )
+
+    async def cancel_queued_jobs(self, user_id: int) -> None:
+        """
+        Marks a user's not-yet-started batches cancelled.
+        """
+        await self.jobs.update_many(
+            {'user_id': user_id, 'status': 'queued'},
+            {'$set': {'status': 'cancelled', 'updated': datetime.datetime.now()}}
+        )
+
+    def get_unfinished_jobs(self):
+        """
+        Returns a cursor over batches that were queued or running.
+        """
+        return self.jobs.find({'status': {'$in': ['queued', 'running']}}).sort('created', 1)
 
-    async def add_traffic(self, id: int) -> None:
+    # Usage Ledger
+    # Lifetime counters live on the user document; per-day buckets live in
+    # `usage_daily` (one document per user per day). Both are written in
+    # bulk by the write-behind ledger (Rexbots/ledger.py).
+    async def apply_usage(self, entries: Dict[Tuple[int, str], List[float]], flush_id: str, retry: bool = False) -> None:
         """
-        Increments usage count for non-premium users.
-        If it's the first use of the cycle, sets the 24h timer.
+        Adds buffered (files, bytes, seconds) per (user_id, day) to the
+        lifetime totals and the daily buckets.
+        Idempotent per flush_id: every touched document remembers its last
+        USAGE_FLUSH_MARKS flush ids, so re-sending a failed flush only
+        reaches the documents it missed.
         """
-        user = await self.col.find_one({'id': id})
-        if not user or await self.is_premium(id):
+        totals: Dict[int, List[float]] = {}
+        daily = []
+        guard = {'$ne': flush_id}
+        mark = {'usage_flushes': {'$each': [flush_id], '$slice': -USAGE_FLUSH_MARKS}}
+        for (user_id, day), (files, size, seconds) in entries.items():
+            total = totals.setdefault(user_id, [0, 0, 0.0])
+            total[0] += files
+            total[1] += size
+            total[2] += seconds
+            daily.append(UpdateOne(
+                {'user_id': user_id, 'day': day, 'usage_flushes': guard},
+                {'$inc': {'files': files, 'bytes': size, 'seconds': seconds}, '$push': mark},
+                upsert=True
+            ))
+        if not daily:
             return
+        try:
+            await self._bulk_once(self.col, [
+                UpdateOne(
+                    {'id': user_id, 'usage_flushes': guard},
+                    {'$inc': {'total_saves': files, 'total_bytes': size, 'total_seconds': seconds}, '$push': mark}
+                )
+                for user_id, (files, size, seconds) in totals.items()
+            ])
+            await self._bulk_once(self.usage, daily)
+        except Exception:
+            # Some totals may have landed; re-read those users instead of guessing
+            for user_id in totals:
+                self.users.invalidate(user_id)
+            raise
+        for user_id, (files, size, seconds) in totals.items():
+            if retry:
+                self.users.invalidate(user_id)
+            else:
+                self.users.increment(user_id, {'total_saves': files, 'total_bytes': size, 'total_seconds': seconds})
+
+    @staticmethod
+    async def _bulk_once(collection, ops: list) -> None:
+        """
+        Unordered bulk_write of guarded updates. A duplicate key on an upsert
+        means the guard filtered out a document that already has this flush,
+        so it counts as applied; any other error is raised.
+        """
+        try:
+            await collection.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            details = e.details or {}
+            failed = [err for err in details.get('writeErrors', []) if err.get('code') != 11000]
+            if failed or details.get('writeConcernErrors'):
+                raise
 
+    async def get_usage_history(self, id: int, days: int = 7) -> List[Dict[str, Any]]:
+        """
+        Returns the user's daily usage buckets of the last `days` days, oldest first.
+        """
+        since = (datetime.date.today() - datetime.timedelta(days=days - 1)).isoformat()
+        cursor = self.usage.find({'user_id': id, 'day': {'$gte': since}}, {'_id': 0, 'usage_flushes': 0}).sort('day', 1)
+        return await cursor.to_list(length=days)
+
+    # Global Statistics
+    # Computed server-side in one aggregation; callers read the cached
+    # snapshot in Rexbots/stats.py instead of calling this per command.
+    async def aggregate_user_stats(self) -> Dict[str, Any]:
+        """
+        Returns global user numbers from a single $facet aggregation.
+        """
         now = datetime.datetime.now()
-        reset_time = user.get('limit_reset_time')
-        # If timer is not running (None), start it for 24 hours from NOW.
-        if reset_time is None:
-            new_reset_time = now + datetime.timedelta(hours=24)
-            await self.col.update_one(
-                {'id': id},
-                {'$set': {'daily_usage': 1, 'limit_reset_time': new_reset_time}}
-            )
-        else:
-            # Just increment
-            await self.col.update_one(
-                {'id': id},
-                {'$inc': {'daily_usage': 1}}
-            )
+        flag = lambda field: {'$sum': {'$cond': [{'$eq': [field, True]}, 1, 0]}}
+        pipeline = [
+            {'$project': {
+                '_id': 0,
+                'is_premium': 1,
+                'is_banned': 1,
+                'has_session': {'$ne': [{'$ifNull': ['$session', None]}, None]},
+                'window_open': {'$gt': ['$limit_reset_time', now]},
+                'daily_usage': {'$ifNull': ['$daily_usage', 0]},
+                'total_saves': {'$ifNull': ['$total_saves', 0]},
+                'total_bytes': {'$ifNull': ['$total_bytes', 0]}
+            }},
+            {'$facet': {
+                'totals': [{'$group': {
+                    '_id': None,
+                    'total_users': {'$sum': 1},
+                    'premium_users': flag('$is_premium'),
+                    'banned_users': flag('$is_banned'),
+                    'active_sessions': flag('$has_session'),
+                    'total_saves': {'$sum': '$total_saves'},
+                    'total_bytes': {'$sum': '$total_bytes'}
+                }}],
+                # Only open 24h windows count; an expired window's usage is stale
+                'today': [
+                    {'$match': {'window_open': True}},
+                    {'$group': {'_id': None, 'active_users': {'$sum': 1}, 'daily_usage': {'$sum': '$daily_usage'}}}
+                ]
+            }}
+        ]
+        result = await self.col.aggregate(pipeline).to_list(length=1)
+        facets = result[0] if result else {}
+        stats = {
+            'total_users': 0, 'premium_users': 0, 'banned_users': 0, 'active_sessions': 0,
+            'total_saves': 0, 'total_bytes': 0, 'active_users': 0, 'daily_usage': 0
+        }
+        for facet in ('totals', 'today'):
+            if facets.get(facet):
+                row = facets[facet][0]
+                row.pop('_id', None)
+                stats.update(row)
+        return stats
+
+    def export_users(self, query: Dict[str, Any]):
+        """
+        Returns a cursor over users matching `query` for exports. Session
+        strings never leave the database; only `session_active` is returned.
+        """
+        return self.col.aggregate([
+            {'$match': query},
+            {'$addFields': {'session_active': {'$ne': [{'$ifNull': ['$session', None]}, None]}}},
+            {'$project': {'_id': 0, 'session': 0}}
+        ])
 
     # Additional Methods
     async def update_user_name(self, id: int, new_name: str) -> None:
         """
         Updates the name of a user.
         """
-        await self.col.update_one({'id': id}, {'$set': {'name': new_name}})
+        await self._update_user(id, {'$set': {'name': new_name}})
         logger.info(f"Updated name for user {id} to {new_name}")
 
     # Info Extractor
@@ -363,7 +922,7 @@ class Database:
         """
         Extracts all information for a user as a dictionary (without _id).
         """
-        user = await self.col.find_one({'id': id}, projection={'_id': 0})
-        return user
+        user = await self._get_user(id)
+        return {k: v for k, v in user.items() if k != '_id'} if user else None
 
 db = Database(DB_URI, DB_NAME)